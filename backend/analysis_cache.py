@@ -0,0 +1,76 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional
+
+
+class AnalysisCache:
+    """Two-tier cache of analysis results: a bounded in-process LRU in front of a Mongo collection with TTL.
+
+    Each entry stores its own ``expires_at`` under a TTL index with
+    expireAfterSeconds=0, so changing ttl_seconds needs no index change.
+    """
+
+    def __init__(self, collection, max_entries: int = 512, ttl_seconds: int = 7 * 24 * 3600):
+        self.collection = collection
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.memory_hits = 0
+
+    @staticmethod
+    def make_key(file_hash: str, analysis_type: str, model: str, prompt_version: str) -> str:
+        return f"{file_hash}:{analysis_type}:{model}:{prompt_version}"
+
+    async def ensure_indexes(self) -> None:
+        await self.collection.create_index("expires_at", expireAfterSeconds=0, name="expires_at_ttl")
+
+    def _remember(self, key: str, result: dict, expires_at: datetime) -> None:
+        self._entries[key] = (result, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[dict]:
+        now = datetime.utcnow()
+        if key in self._entries:
+            result, expires_at = self._entries[key]
+            if expires_at > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self.memory_hits += 1
+                return result
+            del self._entries[key]
+
+        cached = await self.collection.find_one({"_id": key})
+        # The TTL monitor runs about once a minute, so check expiry here too
+        if cached is None or cached["expires_at"] <= now:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        result = cached["result"]
+        self._remember(key, result, cached["expires_at"])
+        return result
+
+    async def set(self, key: str, result: dict) -> None:
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=self.ttl_seconds)
+        self._remember(key, result, expires_at)
+        await self.collection.replace_one(
+            {"_id": key},
+            {"_id": key, "result": result, "created_at": now, "expires_at": expires_at},
+            upsert=True
+        )
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory_hits": self.memory_hits,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "memory_entries": len(self._entries),
+            "max_entries": self.max_entries
+        }
@@ -0,0 +1,90 @@
+import json
+import logging
+import math
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+def as_list(value) -> list:
+    """A list field of the model's JSON; a lone string or object counts as a one-item list."""
+    if isinstance(value, list):
+        return value
+    if isinstance(value, (str, dict)) and value:
+        return [value]
+    return []
+
+
+def clamp_score(value) -> Optional[float]:
+    """A sentiment score in [-1, 1], or None for booleans, non-numbers, NaN and infinities."""
+    if isinstance(value, bool):
+        return None
+    try:
+        score = float(value)
+    except (TypeError, ValueError):
+        return None
+    return max(-1.0, min(1.0, score)) if math.isfinite(score) else None
+
+
+def parse_structured_analysis(response: str) -> Optional[dict]:
+    """Parse a JSON answer to the "full" prompt; returns None when it is not usable."""
+    start, end = response.find("{"), response.rfind("}")
+    if start == -1 or end <= start:
+        return None
+    try:
+        data = json.loads(response[start:end + 1])
+    except ValueError:
+        return None
+    if not isinstance(data, dict) or not isinstance(data.get("summary"), str):
+        return None
+    
+    key_insights = [
+        insight.strip() for insight in as_list(data.get("key_insights")) if isinstance(insight, str) and insight.strip()
+    ][:5]
+    entities = []
+    for entity in as_list(data.get("entities")):
+        if isinstance(entity, dict) and entity.get("name"):
+            entities.append({"name": str(entity["name"]), "type": str(entity.get("type") or "other")})
+        elif isinstance(entity, str) and entity.strip():
+            entities.append({"name": entity.strip(), "type": "other"})
+    sentiment_score = clamp_score(data.get("sentiment_score"))
+    
+    return {
+        "summary": data["summary"][:500],
+        "key_insights": key_insights,
+        "sentiment_score": sentiment_score,
+        "entities": entities
+    }
+
+def parse_analysis_response(response: str, analysis_type: str) -> dict:
+    """Turn the model's answer into DocumentAnalysis fields."""
+    if analysis_type == "full":
+        structured = parse_structured_analysis(response)
+        if structured is not None:
+            return structured
+        logger.warning("Full analysis returned malformed JSON, falling back to free-text parsing")
+    
+    # Parse response for structured data
+    summary = response[:500] if len(response) > 500 else response
+    key_insights = [insight.strip() for insight in response.split('\n') if insight.strip() and len(insight.strip()) > 10][:5]
+    
+    # Extract sentiment score (simplified)
+    sentiment_score = None
+    if "sentiment" in analysis_type.lower() or analysis_type == "full":
+        try:
+            # Simple sentiment extraction from response
+            if "positive" in response.lower():
+                sentiment_score = 0.7
+            elif "negative" in response.lower():
+                sentiment_score = -0.7
+            else:
+                sentiment_score = 0.0
+        except:
+            sentiment_score = 0.0
+    
+    return {
+        "summary": summary,
+        "key_insights": key_insights,
+        "sentiment_score": sentiment_score,
+        "entities": []
+    }
@@ -0,0 +1,273 @@
+import asyncio
+import base64
+import logging
+import zlib
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import bson
+from pymongo.errors import BulkWriteError
+
+try:
+    import zstandard
+except ImportError:  # zstandard is optional; bundles are then gzip compressed
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_CONTENT_TYPE = "application/x-sada-chat-archive"
+DELETE_BATCH_SIZE = 1000
+DUPLICATE_KEY = 11000
+# A pending archive older than this belongs to a run that died mid-delete; the bundle is complete by then
+PENDING_TIMEOUT_SECONDS = 300
+PENDING_POLL_SECONDS = 0.2
+
+
+def _compressor(codec: str, level: int):
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=level).compressobj()
+    return zlib.compressobj(min(level, 9), zlib.DEFLATED, 31)
+
+
+def encode_bundle(messages: List[dict], codec: str, level: int) -> bytes:
+    """Concatenate the messages as BSON and compress them (module level for process pools)."""
+    compressor = _compressor(codec, level)
+    parts = [compressor.compress(bson.encode(message)) for message in messages]
+    parts.append(compressor.flush())
+    return b"".join(parts)
+
+
+def decode_bundle(data: bytes, codec: str) -> List[dict]:
+    """Decompress an archive bundle back into its message documents (module level for process pools)."""
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Archive is zstd compressed but zstandard is not installed")
+        raw = zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    else:
+        raw = zlib.decompressobj(31).decompress(data)
+    return bson.decode_all(raw)
+
+
+class ChatArchive:
+    """Moves idle chat sessions out of ``chat_messages`` into compressed per-session bundles.
+
+    A bundle is the session's messages as concatenated BSON (so datetimes
+    and every other type round-trip exactly), zstd compressed and kept in
+    the blob store; the session document records it under ``archive``,
+    marked ``pending`` until the bundled messages have been deleted.
+    Legacy inline ``file_content`` is moved to the blob store on the way
+    out. ``rehydrate`` restores a session's messages before they are read,
+    waiting out a pending archive so it cannot restore ahead of the delete,
+    and a rehydrated session is not archived again until it has been idle
+    for another ``idle_days``. With ``idle_days`` 0 rehydrate skips its
+    session lookup unless ``find_leftover_archives`` found archives from
+    an earlier configuration. Encoding, compression and decoding go
+    through ``run_cpu`` (or a thread), never the event loop.
+    """
+
+    def __init__(
+        self,
+        sessions,
+        messages,
+        blob_store,
+        store_blob: Callable[[bytes, Optional[str]], Awaitable[str]],
+        idle_days: int = 30,
+        interval: float = 3600.0,
+        batch_size: int = 50,
+        level: int = 10,
+        on_change: Optional[Callable[[str], Awaitable[None]]] = None,
+        run_cpu: Optional[Callable[..., Awaitable]] = None
+    ):
+        self.sessions = sessions
+        self.messages = messages
+        self.blob_store = blob_store
+        self.store_blob = store_blob
+        self.idle_days = idle_days
+        self.interval = interval
+        self.batch_size = batch_size
+        self.level = level
+        self.codec = "zstd" if zstandard is not None else "gzip"
+        self.on_change = on_change
+        self.run_cpu = run_cpu
+        self._task: Optional[asyncio.Task] = None
+        self._inflight = {}
+        self._archiving: Dict[str, asyncio.Event] = {}
+        self.has_archives = idle_days > 0
+        self.archived_sessions = 0
+        self.archived_messages = 0
+        self.stripped_attachments = 0
+        self.rehydrated = 0
+        self.skipped = 0
+
+    async def find_leftover_archives(self) -> bool:
+        """With archiving disabled, check once whether sessions archived earlier still need restoring."""
+        if not self.has_archives:
+            self.has_archives = await self.sessions.find_one({"archive": {"$exists": True}}, {"_id": 1}) is not None
+        return self.has_archives
+
+    async def _run_cpu(self, size: int, func, *args):
+        if self.run_cpu is not None:
+            return await self.run_cpu(size, func, *args)
+        return await asyncio.to_thread(func, *args)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                archived = await self.compact()
+                if archived:
+                    logger.info(f"Archived {archived} idle chat sessions")
+            except Exception as e:
+                logger.error(f"Chat compaction failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    async def compact(self) -> int:
+        """Archive up to batch_size sessions idle for idle_days; returns how many were archived."""
+        cutoff = datetime.utcnow() - timedelta(days=self.idle_days)
+        query = {
+            "updated_at": {"$lt": cutoff},
+            "archive": {"$exists": False},
+            "$or": [{"rehydrated_at": {"$exists": False}}, {"rehydrated_at": {"$lt": cutoff}}]
+        }
+        cursor = self.sessions.find(query, {"_id": 0, "id": 1, "updated_at": 1})
+        sessions = await cursor.sort("updated_at", 1).limit(self.batch_size).to_list(self.batch_size)
+        archived = 0
+        for session in sessions:
+            if await self.archive_session(session["id"], session["updated_at"]):
+                archived += 1
+        return archived
+
+    async def _strip_inline_content(self, message: dict) -> None:
+        content = message["file_content"]
+        try:
+            data = await self._run_cpu(len(content), base64.b64decode, content)
+        except Exception as e:
+            # Keep undecodable content as it is rather than lose it
+            logger.error(f"Could not move inline attachment of message {message.get('id')}: {str(e)}")
+            return
+        if not message.get("file_hash"):
+            message["file_hash"] = await self.store_blob(data, message.get("file_type"))
+        del message["file_content"]
+        self.stripped_attachments += 1
+
+    async def archive_session(self, session_id: str, updated_at: datetime) -> bool:
+        """Bundle one session's messages; gives up if the session changed since updated_at."""
+        messages = []
+        cursor = self.messages.find({"session_id": session_id}, {"_id": 0}).sort([("timestamp", 1), ("id", 1)])
+        async for message in cursor:
+            if message.get("file_content"):
+                await self._strip_inline_content(message)
+            messages.append(message)
+        message_ids = [message["id"] for message in messages]
+        text_size = sum(len(message.get("user_message") or "") + len(message.get("ai_response") or "") for message in messages)
+        bundle = await self._run_cpu(text_size, encode_bundle, messages, self.codec, self.level)
+        bundle_hash = await self.store_blob(bundle, ARCHIVE_CONTENT_TYPE)
+
+        # Only claim the session if nothing was written to it while the bundle was built
+        result = await self.sessions.update_one(
+            {"id": session_id, "updated_at": updated_at, "archive": {"$exists": False}},
+            {"$set": {"archive": {
+                "hash": bundle_hash,
+                "codec": self.codec,
+                "message_count": len(message_ids),
+                "size": len(bundle),
+                "archived_at": datetime.utcnow(),
+                "pending": True
+            }}}
+        )
+        if result.modified_count == 0:
+            self.skipped += 1
+            return False
+
+        done = self._archiving[session_id] = asyncio.Event()
+        try:
+            # Delete exactly what was bundled; a message that raced in stays hot and survives rehydration
+            for start in range(0, len(message_ids), DELETE_BATCH_SIZE):
+                await self.messages.delete_many(
+                    {"session_id": session_id, "id": {"$in": message_ids[start:start + DELETE_BATCH_SIZE]}}
+                )
+        finally:
+            # Even after a failed delete the bundle is complete, so restoring from it is safe
+            await self.sessions.update_one(
+                {"id": session_id, "archive.hash": bundle_hash}, {"$unset": {"archive.pending": ""}}
+            )
+            del self._archiving[session_id]
+            done.set()
+        self.has_archives = True
+        self.archived_sessions += 1
+        self.archived_messages += len(message_ids)
+        if self.on_change is not None:
+            await self.on_change(session_id)
+        return True
+
+    async def rehydrate(self, session_id: str) -> None:
+        """Restore an archived session's messages into chat_messages; a no-op for hot sessions."""
+        if not self.has_archives:
+            return
+        if session_id not in self._inflight:
+            self._inflight[session_id] = asyncio.ensure_future(self._rehydrate(session_id))
+            self._inflight[session_id].add_done_callback(lambda _: self._inflight.pop(session_id, None))
+        await asyncio.shield(self._inflight[session_id])
+
+    async def _settled_archive(self, session_id: str) -> Optional[dict]:
+        """The session's archive once no run is still deleting its messages, or None when it is hot."""
+        while True:
+            session = await self.sessions.find_one({"id": session_id}, {"_id": 0, "archive": 1})
+            archive = (session or {}).get("archive")
+            if not archive or not archive.get("pending"):
+                return archive
+            if session_id in self._archiving:
+                await self._archiving[session_id].wait()
+            elif datetime.utcnow() - archive["archived_at"] > timedelta(seconds=PENDING_TIMEOUT_SECONDS):
+                return archive
+            else:
+                # Being archived by another process
+                await asyncio.sleep(PENDING_POLL_SECONDS)
+
+    async def _rehydrate(self, session_id: str) -> None:
+        archive = await self._settled_archive(session_id)
+        if not archive:
+            return
+        data = await asyncio.to_thread(self.blob_store.path_for(archive["hash"]).read_bytes)
+        documents = await self._run_cpu(len(data), decode_bundle, data, archive["codec"])
+        if documents:
+            try:
+                await self.messages.insert_many(documents, ordered=False)
+            except BulkWriteError as e:
+                # Messages left behind by an interrupted archive run are already present
+                if any(error["code"] != DUPLICATE_KEY for error in e.details.get("writeErrors", [])):
+                    raise
+        await self.sessions.update_one(
+            {"id": session_id, "archive.hash": archive["hash"]},
+            {"$unset": {"archive": ""}, "$set": {"rehydrated_at": datetime.utcnow()}}
+        )
+        self.rehydrated += 1
+        # Pages cached while the session was archived must not outlive the restore
+        if self.on_change is not None:
+            await self.on_change(session_id)
+
+    def stats(self) -> dict:
+        return {
+            "codec": self.codec,
+            "idle_days": self.idle_days,
+            "running": self._task is not None,
+            "archived_sessions": self.archived_sessions,
+            "archived_messages": self.archived_messages,
+            "stripped_attachments": self.stripped_attachments,
+            "rehydrated": self.rehydrated,
+            "skipped": self.skipped,
+            "rehydrating": len(self._inflight)
+        }
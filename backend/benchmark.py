@@ -0,0 +1,381 @@
+"""In-process load benchmark for the SaDA AI backend.
+
+Boots the FastAPI app against a fake LlmChat and a local Mongo stand-in
+(mongomock-motor, or a real server via --mongo-url), drives concurrent
+workloads through an in-process ASGI client and reports latency
+percentiles, throughput and peak RSS.
+
+    python benchmark.py                                  # run everything
+    python benchmark.py chat_burst history --concurrency 64
+    python benchmark.py --save-baseline benchmarks/baseline.json
+    python benchmark.py --compare benchmarks/baseline.json --tolerance 0.25
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+import types
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Awaitable, Callable, List
+
+ROOT_DIR = Path(__file__).parent
+DEFAULT_RESPONSE = (
+    "The customer reports a problem with the device.\n"
+    "Positive: the product arrived on time and works well otherwise.\n"
+    "Suggested next step is a replacement part."
+)
+
+
+class FakeLlmChat:
+    """Stands in for LlmChat: answers after a fixed latency."""
+
+    latency = 0.05
+    response = DEFAULT_RESPONSE
+
+    def __init__(self, api_key=None, session_id=None, system_message=None):
+        self.session_id = session_id
+
+    def with_model(self, provider, model):
+        return self
+
+    async def send_message(self, user_message) -> str:
+        await asyncio.sleep(self.latency)
+        return self.response
+
+
+class StreamingFakeLlmChat(FakeLlmChat):
+    """FakeLlmChat that also streams its answer in stream_chunks pieces."""
+
+    stream_chunks = 8
+
+    async def stream_message(self, user_message):
+        step = max(1, len(self.response) // self.stream_chunks)
+        for start in range(0, len(self.response), step):
+            await asyncio.sleep(self.latency / self.stream_chunks)
+            yield self.response[start:start + step]
+
+
+def make_fake_llm(latency: float, stream_chunks: int) -> type:
+    """Return a configured fake; stream_chunks=0 gives one without stream_message."""
+    if stream_chunks == 0:
+        return type("ConfiguredFakeLlmChat", (FakeLlmChat,), {"latency": latency})
+    return type("ConfiguredFakeLlmChat", (StreamingFakeLlmChat,), {"latency": latency, "stream_chunks": stream_chunks})
+
+
+def install_llm_module() -> None:
+    """Register placeholder message classes when the provider SDK is not installed."""
+    try:
+        import emergentintegrations.llm.chat  # noqa: F401
+        return
+    except ImportError:
+        pass
+
+    class UserMessage:
+        def __init__(self, text, file_contents=None):
+            self.text = text
+            self.file_contents = file_contents or []
+
+    class FileContentWithMimeType:
+        def __init__(self, file_path, mime_type):
+            self.file_path = file_path
+            self.mime_type = mime_type
+
+    chat = types.ModuleType("emergentintegrations.llm.chat")
+    chat.LlmChat = FakeLlmChat
+    chat.UserMessage = UserMessage
+    chat.FileContentWithMimeType = FileContentWithMimeType
+    for name in ("emergentintegrations", "emergentintegrations.llm"):
+        sys.modules.setdefault(name, types.ModuleType(name))
+    sys.modules["emergentintegrations.llm.chat"] = chat
+
+
+def load_server(args):
+    """Import server.py wired to the fake LLM and the chosen Mongo."""
+    workdir = Path(tempfile.mkdtemp(prefix="sada_bench_"))
+    os.environ["MONGO_URL"] = args.mongo_url or "mongodb://localhost:27017"
+    os.environ["DB_NAME"] = f"sada_bench_{uuid.uuid4().hex[:8]}"
+    for variable, name in (("BLOB_STORE_DIR", "blobs"), ("SPOOL_DIR", "spool"), ("SEARCH_INDEX_DIR", "search")):
+        os.environ[variable] = str(workdir / name)
+    # The fake provider has no quota; keep the governor from shaping the load
+    os.environ.setdefault("LLM_REQUESTS_PER_MINUTE", "1000000000")
+    os.environ.setdefault("LLM_TOKENS_PER_MINUTE", "1000000000000")
+    os.environ.setdefault("LLM_MAX_CONCURRENCY", "100000")
+
+    if not args.mongo_url:
+        import motor.motor_asyncio
+        from mongomock_motor import AsyncMongoMockClient
+        motor.motor_asyncio.AsyncIOMotorClient = AsyncMongoMockClient
+
+    install_llm_module()
+    sys.path.insert(0, str(ROOT_DIR))
+    import server
+    server.LlmChat = make_fake_llm(args.llm_latency, args.stream_chunks)
+    return server
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KB on Linux, bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1)
+
+
+async def run_load(request: Callable[[int], Awaitable[bool]], total: int, concurrency: int) -> dict:
+    """Call request(i) total times with at most concurrency in flight; request returns success."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def timed(index: int):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                ok = await request(index)
+            except Exception:
+                ok = False
+            latencies.append(time.perf_counter() - started)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    await asyncio.gather(*(timed(index) for index in range(total)))
+    elapsed = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "errors": errors,
+        "concurrency": concurrency,
+        "rps": round(total / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        # Whole process (client + app); the fake LLM only sleeps, so this is our own work
+        "cpu_ms_per_request": round(cpu * 1000 / total, 2),
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+
+async def create_session(http) -> str:
+    response = await http.post("/api/chat/sessions", json={"session_name": "bench", "session_type": "customer_support"})
+    return response.json()["id"]
+
+
+async def chat_burst(server, http, args) -> dict:
+    session_ids = [await create_session(http) for _ in range(max(1, args.concurrency // 8))]
+
+    async def request(index: int) -> bool:
+        response = await http.post("/api/chat/message", json={
+            "session_id": session_ids[index % len(session_ids)],
+            "user_message": f"My printer shows error {index}, what should I do?"
+        })
+        return response.status_code == 200
+
+    return await run_load(request, args.requests, args.concurrency)
+
+
+async def chat_stream(server, http, args) -> dict:
+    session_id = await create_session(http)
+
+    async def request(index: int) -> bool:
+        async with http.stream("POST", "/api/chat/message/stream", json={
+            "session_id": session_id,
+            "user_message": f"Streaming question {index}"
+        }) as response:
+            body = b"".join([chunk async for chunk in response.aiter_bytes()])
+        return response.status_code == 200 and b"event: done" in body
+
+    return await run_load(request, args.requests, args.concurrency)
+
+
+async def large_upload(server, http, args) -> dict:
+    session_id = await create_session(http)
+    payload = os.urandom(args.upload_mb * 1024 * 1024)
+
+    async def request(index: int) -> bool:
+        # Distinct content per request so neither the blob store nor the analysis cache short-circuits
+        content = index.to_bytes(8, "big") + payload
+        response = await http.post(
+            "/api/documents/analyze/upload",
+            files={"file": (f"upload-{index}.bin", content, "application/octet-stream")},
+            data={"session_id": session_id, "analysis_type": "summary"}
+        )
+        return response.status_code == 200
+
+    return await run_load(request, max(1, args.requests // 10), max(1, args.concurrency // 4))
+
+
+async def seed_history(server, session_id: str, count: int) -> None:
+    started = datetime.utcnow() - timedelta(seconds=count)
+    batch = []
+    for index in range(count):
+        batch.append(server.ChatMessage(
+            session_id=session_id,
+            user_message=f"Historic question {index}",
+            ai_response=DEFAULT_RESPONSE,
+            timestamp=started + timedelta(seconds=index)
+        ).dict())
+        if len(batch) == 1000:
+            await server.db.chat_messages.insert_many(batch)
+            batch = []
+    if batch:
+        await server.db.chat_messages.insert_many(batch)
+
+
+async def history(server, http, args) -> dict:
+    """Each request loads a whole history_size-message session page by page."""
+    session_id = await create_session(http)
+    await seed_history(server, session_id, args.history_size)
+
+    async def request(index: int) -> bool:
+        loaded = 0
+        after = None
+        while True:
+            # The unused "run" parameter gives every request its own response cache keys,
+            # so this measures the Mongo + serialization path rather than cache hits
+            params = {"limit": server.MAX_PAGE_SIZE, "run": index}
+            if after:
+                params["after"] = after
+            response = await http.get(f"/api/chat/messages/{session_id}", params=params)
+            if response.status_code != 200:
+                return False
+            loaded += len(response.json())
+            after = response.headers.get("x-next-cursor")
+            if not after:
+                return loaded == args.history_size
+
+    return await run_load(request, max(1, args.requests // 20), max(1, args.concurrency // 8))
+
+
+def pydantic_page(server, documents: list) -> bytes:
+    """What a list endpoint cost before the orjson read path: models, response_model validation, json.dumps."""
+    from pydantic import TypeAdapter
+
+    adapter = TypeAdapter(List[server.ChatMessage])
+    models = [server.ChatMessage(**document) for document in documents]
+    validated = adapter.validate_python(models, from_attributes=True)
+    return json.dumps(adapter.dump_python(validated, mode="json")).encode()
+
+
+async def serialization(server, http, args) -> dict:
+    """Serialize one full history page in-process, without Mongo or HTTP in the way."""
+    from starlette.responses import Response
+
+    projection = server.list_projection(server.ChatMessage)
+    documents = [
+        {field: value for field, value in server.ChatMessage(
+            session_id="bench",
+            user_message=f"Historic question {index}",
+            ai_response=DEFAULT_RESPONSE,
+            file_hash=f"{index:064x}" if index % 10 == 0 else None,
+            file_type="image/png" if index % 10 == 0 else None
+        ).dict().items() if field in projection}
+        for index in range(server.MAX_PAGE_SIZE)
+    ]
+    iterations = max(1, args.requests // 10)
+
+    cpu_started = time.process_time()
+    for _ in range(iterations):
+        pydantic_page(server, documents)
+    pydantic_cpu = (time.process_time() - cpu_started) / iterations
+
+    async def request(index: int) -> bool:
+        return (await server.list_response(documents, server.ChatMessage, Response(), None)).status_code == 200
+
+    results = await run_load(request, iterations, 1)
+    results["pydantic_cpu_ms_per_request"] = round(pydantic_cpu * 1000, 2)
+    return results
+
+
+WORKLOADS = {
+    "chat_burst": chat_burst,
+    "chat_stream": chat_stream,
+    "large_upload": large_upload,
+    "history": history,
+    "serialization": serialization
+}
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Describe every workload whose p95 rose or throughput fell by more than tolerance."""
+    regressions = []
+    for name, current in results["workloads"].items():
+        previous = baseline.get("workloads", {}).get(name)
+        if previous is None:
+            continue
+        if current["errors"] > previous["errors"]:
+            regressions.append(f"{name}: {current['errors']} errors (baseline {previous['errors']})")
+        if current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {current['p95_ms']}ms (baseline {previous['p95_ms']}ms)")
+        if current["rps"] < previous["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: {current['rps']} req/s (baseline {previous['rps']} req/s)")
+    return regressions
+
+
+async def run(args) -> dict:
+    import httpx
+
+    server = load_server(args)
+    await server.app.router.startup()
+    results = {"created_at": datetime.utcnow().isoformat(), "config": {
+        key: value for key, value in vars(args).items() if key not in ("save_baseline", "compare", "mongo_url")
+    }, "workloads": {}}
+    try:
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as http:
+            for name in args.workloads:
+                results["workloads"][name] = await WORKLOADS[name](server, http, args)
+                print(f"{name:<14} {json.dumps(results['workloads'][name])}")
+    finally:
+        await server.app.router.shutdown()
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("workloads", nargs="*", metavar="WORKLOAD", help=f"any of {', '.join(WORKLOADS)} (default: all)")
+    parser.add_argument("--requests", type=int, default=500, help="requests per chat workload")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="fake LLM seconds per call")
+    parser.add_argument("--stream-chunks", type=int, default=8, help="0 disables fake streaming")
+    parser.add_argument("--upload-mb", type=int, default=8)
+    parser.add_argument("--history-size", type=int, default=10000)
+    parser.add_argument("--mongo-url", help="real MongoDB to use instead of mongomock-motor")
+    parser.add_argument("--save-baseline", metavar="PATH")
+    parser.add_argument("--compare", metavar="PATH", help="baseline to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+    args.workloads = args.workloads or list(WORKLOADS)
+    unknown = set(args.workloads) - set(WORKLOADS)
+    if unknown:
+        parser.error(f"unknown workloads: {', '.join(sorted(unknown))}")
+
+    results = asyncio.run(run(args))
+
+    if args.save_baseline:
+        Path(args.save_baseline).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.save_baseline).write_text(json.dumps(results, indent=2) + "\n")
+    if args.compare:
+        regressions = compare(results, json.loads(Path(args.compare).read_text()), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+import asyncio
+import hashlib
+import os
+import re
+import shutil
+import uuid
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable, Optional, Tuple, Union
+
+from spool import SpoolManager
+
+CHUNK_SIZE = 1024 * 1024
+HASH_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+def is_valid_hash(digest: str) -> bool:
+    return bool(HASH_PATTERN.match(digest or ""))
+
+
+def sha256_hex(data: bytes) -> str:
+    # Module level so a process pool can pickle it
+    return hashlib.sha256(data).hexdigest()
+
+
+class BlobStore:
+    """Content-addressed file store keyed by SHA-256, sharded into two directory levels.
+
+    Hashing goes through ``run_cpu`` (a CpuOffloader's ``run``) when given,
+    otherwise a thread.
+    """
+
+    def __init__(
+        self,
+        root: Union[str, Path],
+        spool: Optional[SpoolManager] = None,
+        run_cpu: Optional[Callable[..., Awaitable]] = None
+    ):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.spool = spool or SpoolManager(self.root / ".spool", quota_bytes=1024 ** 3, run_cpu=run_cpu)
+        self.run_cpu = run_cpu
+
+    def path_for(self, digest: str) -> Path:
+        if not is_valid_hash(digest):
+            raise ValueError(f"Invalid blob hash: {digest}")
+        return self.root / digest[:2] / digest[2:4] / digest
+
+    def exists(self, digest: str) -> bool:
+        return is_valid_hash(digest) and self.path_for(digest).is_file()
+
+    def size(self, digest: str) -> int:
+        return self.path_for(digest).stat().st_size
+
+    def _write_bytes(self, data: bytes, digest: str) -> None:
+        target = self.path_for(digest)
+        if target.is_file():
+            return
+
+        # Write to a unique temp name then rename, so readers never see partial blobs
+        target.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = target.parent / f".{digest}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, target)
+        finally:
+            if temp_path.exists():
+                temp_path.unlink()
+
+    def _adopt(self, spool_path: Path, digest: str) -> None:
+        target = self.path_for(digest)
+        if target.is_file():
+            # Content already stored; the spool file is simply discarded
+            return
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # Copy next to the target first so the final rename is atomic even across filesystems
+        temp_path = target.parent / f".{digest}.{uuid.uuid4().hex}.tmp"
+        try:
+            shutil.move(str(spool_path), temp_path)
+            os.replace(temp_path, target)
+        finally:
+            if temp_path.exists():
+                temp_path.unlink()
+
+    async def put_stream(self, chunks: AsyncIterator[bytes]) -> Tuple[str, int]:
+        """Spool an async stream of chunks, hash the spooled file, then store it; returns (digest, size)."""
+        async with self.spool.open() as spool_file:
+            async for chunk in chunks:
+                await spool_file.write(chunk)
+            digest = await spool_file.finish()
+            await asyncio.to_thread(self._adopt, spool_file.path, digest)
+            return digest, spool_file.size
+
+    async def put_bytes(self, data: bytes) -> str:
+        """Store data (deduplicated by content) and return its SHA-256 hex digest."""
+        if self.run_cpu is not None:
+            digest = await self.run_cpu(len(data), sha256_hex, data)
+        else:
+            digest = await asyncio.to_thread(sha256_hex, data)
+        await asyncio.to_thread(self._write_bytes, data, digest)
+        return digest
+
+    def _read_range(self, digest: str, start: int, length: int) -> bytes:
+        with open(self.path_for(digest), "rb") as f:
+            f.seek(start)
+            return f.read(length)
+
+    async def iter_range(self, digest: str, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        """Yield the blob's bytes from start to end (inclusive) in CHUNK_SIZE pieces."""
+        if end is None:
+            end = self.size(digest) - 1
+        position = start
+        while position <= end:
+            length = min(CHUNK_SIZE, end - position + 1)
+            chunk = await asyncio.to_thread(self._read_range, digest, position, length)
+            if not chunk:
+                break
+            position += len(chunk)
+            yield chunk
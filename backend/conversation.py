@@ -0,0 +1,148 @@
+from datetime import datetime
+from typing import Awaitable, Callable, List, Optional
+
+# Rough chars-per-token ratio; avoids pulling in a model-specific tokenizer
+CHARS_PER_TOKEN = 4
+
+# Kept free for the next customer message when deciding which turns still fit verbatim
+NEXT_MESSAGE_TOKENS = 200
+
+TURN_FIELDS = {"_id": 0, "id": 1, "user_message": 1, "ai_response": 1, "file_type": 1, "file_hash": 1, "timestamp": 1}
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def render_turn(message: dict) -> str:
+    lines = [f"Customer: {message['user_message']}"]
+    if message.get("file_hash"):
+        # Earlier attachments are referenced, never re-sent
+        lines.append(f"[Customer attached {message.get('file_type') or 'a file'} (blob {message['file_hash'][:12]})]")
+    lines.append(f"SaDA AI: {message['ai_response']}")
+    return "\n".join(lines)
+
+
+class ConversationContext:
+    """Builds support prompts from stored chat history within a token budget.
+
+    The newest turns are included verbatim, newest first, until the budget is
+    spent. Older turns are folded into a per-session running summary, stored
+    in ``chat_summaries``: every ``summary_every`` messages, and as soon as
+    some unsummarized turns no longer fit the verbatim budget, so no turn
+    is left out of both.
+    """
+
+    def __init__(self, messages, summaries, budget_tokens: int = 4000, summary_every: int = 10):
+        self.messages = messages
+        self.summaries = summaries
+        self.budget_tokens = budget_tokens
+        self.summary_every = summary_every
+        self._rolling = set()
+
+    @property
+    def enabled(self) -> bool:
+        return self.budget_tokens > 0
+
+    @staticmethod
+    def _after(session_id: str, summary: Optional[dict]) -> dict:
+        query = {"session_id": session_id}
+        if summary and summary.get("covered_timestamp"):
+            timestamp, last_id = summary["covered_timestamp"], summary["covered_id"]
+            query["$or"] = [
+                {"timestamp": {"$gt": timestamp}},
+                {"timestamp": timestamp, "id": {"$gt": last_id}}
+            ]
+        return query
+
+    async def build_prompt(self, session_id: str, user_message: str) -> str:
+        summary = await self.summaries.find_one({"session_id": session_id})
+        summary_text = summary["summary"] if summary else ""
+        remaining = self.budget_tokens - estimate_tokens(summary_text) - estimate_tokens(user_message)
+
+        # Walk back from the newest uncovered turn until the budget runs out
+        recent: List[str] = []
+        cursor = self.messages.find(self._after(session_id, summary), TURN_FIELDS).sort(
+            [("timestamp", -1), ("id", -1)]
+        )
+        async for message in cursor:
+            turn = render_turn(message)
+            cost = estimate_tokens(turn)
+            if cost > remaining:
+                break
+            recent.append(turn)
+            remaining -= cost
+        recent.reverse()
+
+        if not summary_text and not recent:
+            return user_message
+
+        sections = []
+        if summary_text:
+            sections.append(f"Summary of the earlier conversation:\n{summary_text}")
+        if recent:
+            sections.append("Recent conversation:\n" + "\n\n".join(recent))
+        sections.append(f"Current customer message:\n{user_message}")
+        return "\n\n".join(sections)
+
+    async def roll_up(self, session_id: str, summarize: Callable[[str], Awaitable[str]]) -> bool:
+        """Fold the oldest uncovered turns into the summary when they are due or no longer fit.
+
+        Once ``2 * summary_every`` turns are uncovered, all but the newest
+        ``summary_every`` are folded; before that, the turns that would not
+        fit the verbatim budget are. Returns True if the summary changed.
+        """
+        if session_id in self._rolling:
+            return False
+        self._rolling.add(session_id)
+        try:
+            return await self._roll_up(session_id, summarize)
+        finally:
+            self._rolling.discard(session_id)
+
+    def _fitting(self, turns: List[dict], summary_text: str) -> int:
+        """How many of the newest turns (newest first) fit verbatim next to the summary."""
+        remaining = self.budget_tokens - estimate_tokens(summary_text) - NEXT_MESSAGE_TOKENS
+        for count, message in enumerate(turns):
+            remaining -= estimate_tokens(render_turn(message))
+            if remaining < 0:
+                return count
+        return len(turns)
+
+    async def _roll_up(self, session_id: str, summarize: Callable[[str], Awaitable[str]]) -> bool:
+        summary = await self.summaries.find_one({"session_id": session_id})
+        previous = summary["summary"] if summary else ""
+        turns = await self.messages.find(self._after(session_id, summary), TURN_FIELDS).sort(
+            [("timestamp", -1), ("id", -1)]
+        ).to_list(None)
+        fitting = self._fitting(turns, previous)
+        if len(turns) >= 2 * self.summary_every:
+            keep = min(self.summary_every, fitting)
+        elif fitting < len(turns):
+            keep = fitting
+        else:
+            return False
+        batch = turns[keep:][::-1]
+
+        prompt = (
+            "Update the running summary of this customer support conversation. "
+            "Keep customer details, reported problems, decisions and open questions; drop pleasantries. "
+            "Reply with the updated summary only.\n\n"
+            f"Current summary:\n{previous or '(none)'}\n\n"
+            "New turns:\n" + "\n\n".join(render_turn(message) for message in batch)
+        )
+        new_summary = (await summarize(prompt)).strip()
+
+        last = batch[-1]
+        await self.summaries.update_one(
+            {"session_id": session_id},
+            {"$set": {
+                "summary": new_summary,
+                "covered_timestamp": last["timestamp"],
+                "covered_id": last["id"],
+                "covered_count": (summary or {}).get("covered_count", 0) + len(batch),
+                "updated_at": datetime.utcnow()
+            }},
+            upsert=True
+        )
+        return True
@@ -0,0 +1,148 @@
+"""Mongo index set for the queries the API issues.
+
+Run ``python db_indexes.py`` to create the indexes and print the explain()
+plan behind each route's query; exits non-zero if any of them still needs a
+collection scan or an in-memory sort.
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+INDEXES = {
+    "status_checks": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel([("timestamp", ASCENDING), ("id", ASCENDING)], name="timestamp_id"),
+    ],
+    "chat_sessions": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel([("updated_at", DESCENDING), ("id", DESCENDING)], name="updated_at_id"),
+    ],
+    "chat_messages": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel([("session_id", ASCENDING), ("timestamp", ASCENDING), ("id", ASCENDING)], name="session_timestamp_id"),
+        IndexModel([("timestamp", ASCENDING), ("id", ASCENDING)], name="timestamp_id"),
+    ],
+    "document_analyses": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel([("session_id", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)], name="session_timestamp_id"),
+        IndexModel([("timestamp", DESCENDING), ("id", DESCENDING)], name="timestamp_id"),
+    ],
+    "chat_summaries": [
+        IndexModel([("session_id", ASCENDING)], unique=True, name="session_unique"),
+    ],
+    "analysis_jobs": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel([("status", ASCENDING), ("heartbeat_at", ASCENDING)], name="status_heartbeat"),
+    ],
+    "blobs": [
+        IndexModel([("hash", ASCENDING)], unique=True, name="hash_unique"),
+    ],
+    "idempotency_keys": [
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0, name="expires_at_ttl"),
+    ],
+}
+
+# (route, collection, filter, sort) for every list/lookup query in server.py;
+# list routes page by keyset on (sort field, id)
+ROUTE_QUERIES = [
+    ("GET /api/status", "status_checks", {}, [("timestamp", ASCENDING), ("id", ASCENDING)]),
+    ("GET /api/chat/sessions", "chat_sessions", {}, [("updated_at", DESCENDING), ("id", DESCENDING)]),
+    ("GET /api/chat/sessions/{session_id}", "chat_sessions", {"id": "example"}, None),
+    ("GET /api/chat/messages/{session_id}", "chat_messages", {"session_id": "example"},
+     [("timestamp", ASCENDING), ("id", ASCENDING)]),
+    ("GET /api/documents/analyses", "document_analyses", {}, [("timestamp", DESCENDING), ("id", DESCENDING)]),
+    ("GET /api/documents/analyses/{session_id}", "document_analyses", {"session_id": "example"},
+     [("timestamp", DESCENDING), ("id", DESCENDING)]),
+    ("GET /api/jobs/{job_id}", "analysis_jobs", {"id": "example"}, None),
+    ("search index follower", "document_analyses", {"timestamp": {"$gte": datetime(2024, 1, 1)}}, [("timestamp", ASCENDING)]),
+    ("search index follower", "chat_messages", {"timestamp": {"$gte": datetime(2024, 1, 1)}}, [("timestamp", ASCENDING)]),
+    ("GET /api/blobs/{file_hash}", "blobs", {"hash": "example"}, None),
+]
+
+def after_query(query: dict, sort: list) -> dict:
+    """The route's filter as list calls send it with ?after=<timestamp>,<id> (server.keyset_filter)."""
+    (field, direction), _ = sort
+    op = "$gt" if direction == ASCENDING else "$lt"
+    cursor_value = datetime(2024, 1, 1)
+    return {**query, "$or": [{field: {op: cursor_value}}, {field: cursor_value, "id": {op: "example"}}]}
+
+
+# Later pages add an $or keyset condition, which can be planned differently from the first page
+ROUTE_QUERIES += [
+    (f"{route}?after=", collection_name, after_query(query, sort), sort)
+    for route, collection_name, query, sort in list(ROUTE_QUERIES)
+    if route.startswith("GET ") and sort and len(sort) == 2 and sort[1][0] == "id"
+]
+
+# Plan stages that mean the query is not served by an index
+BAD_STAGES = {"COLLSCAN", "SORT"}
+
+
+async def ensure_indexes(db) -> None:
+    """Create every index in INDEXES; safe to run on each startup."""
+    for collection_name, indexes in INDEXES.items():
+        await db[collection_name].create_indexes(indexes)
+
+
+def plan_stages(plan: dict) -> list:
+    """Flatten an explain() plan tree into its stage names, outermost first."""
+    stages = []
+    while plan:
+        if "queryPlan" in plan:
+            plan = plan["queryPlan"]
+            continue
+        stages.append(plan.get("stage"))
+        if "inputStage" in plan:
+            plan = plan["inputStage"]
+        elif plan.get("inputStages"):
+            for child in plan["inputStages"]:
+                stages.extend(plan_stages(child))
+            break
+        else:
+            break
+    return stages
+
+
+async def explain_route_queries(db) -> list:
+    """Return one report dict per route query with its winning plan stages."""
+    reports = []
+    for route, collection_name, query, sort in ROUTE_QUERIES:
+        cursor = db[collection_name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explanation = await cursor.explain()
+        stages = plan_stages(explanation["queryPlanner"]["winningPlan"])
+        reports.append({
+            "route": route,
+            "collection": collection_name,
+            "stages": stages,
+            "ok": not BAD_STAGES.intersection(stages),
+        })
+    return reports
+
+
+async def main() -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        await ensure_indexes(db)
+        reports = await explain_route_queries(db)
+    finally:
+        client.close()
+
+    for report in reports:
+        status = "OK  " if report["ok"] else "FAIL"
+        print(f"{status} {report['route']:<45} {' <- '.join(report['stages'])}")
+    return 0 if all(report["ok"] for report in reports) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
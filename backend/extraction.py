@@ -0,0 +1,102 @@
+import csv
+import re
+import zipfile
+from typing import List, Optional
+from xml.etree import ElementTree
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # PDF extraction is optional; such files fall back to whole-file analysis
+    PdfReader = None
+
+TEXT_TYPES = ("text/plain", "text/markdown", "application/json", "application/xml", "text/xml", "text/html")
+# Windows browsers label .csv uploads application/vnd.ms-excel too
+CSV_TYPES = ("text/csv", "application/csv", "application/vnd.ms-excel")
+# Compound File header of legacy binary Office files (.xls, .doc), which are not text
+OLE_MAGIC = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+DOCX_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+WORD_NAMESPACE = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+def _detect_kind(path: str, content_type: str) -> Optional[str]:
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    with open(path, "rb") as f:
+        head = f.read(8)
+    if content_type == "application/pdf" or head.startswith(b"%PDF"):
+        return "pdf"
+    if content_type == DOCX_TYPE or (head.startswith(b"PK") and zipfile.is_zipfile(path)):
+        return "docx"
+    if head.startswith(OLE_MAGIC):
+        return None
+    if content_type in CSV_TYPES:
+        return "csv"
+    if content_type in TEXT_TYPES or content_type.startswith("text/"):
+        return "text"
+    return None
+
+
+def _extract_pdf(path: str) -> Optional[str]:
+    if PdfReader is None:
+        return None
+    reader = PdfReader(path)
+    return "\n\n".join(page.extract_text() or "" for page in reader.pages)
+
+
+def _extract_docx(path: str) -> Optional[str]:
+    with zipfile.ZipFile(path) as archive:
+        if "word/document.xml" not in archive.namelist():
+            return None
+        root = ElementTree.fromstring(archive.read("word/document.xml"))
+    paragraphs = []
+    for paragraph in root.iter(f"{WORD_NAMESPACE}p"):
+        text = "".join(node.text or "" for node in paragraph.iter(f"{WORD_NAMESPACE}t"))
+        if text:
+            paragraphs.append(text)
+    return "\n\n".join(paragraphs)
+
+
+def _extract_csv(path: str) -> str:
+    with open(path, newline="", encoding="utf-8", errors="replace") as f:
+        rows = csv.reader(f)
+        return "\n".join(" | ".join(row) for row in rows)
+
+
+def extract_text(path: str, content_type: str) -> Optional[str]:
+    """Return the document's text, or None when the format is not supported locally.
+
+    Blocking; run it in a worker thread.
+    """
+    kind = _detect_kind(path, content_type)
+    if kind == "pdf":
+        text = _extract_pdf(path)
+    elif kind == "docx":
+        text = _extract_docx(path)
+    elif kind == "csv":
+        text = _extract_csv(path)
+    elif kind == "text":
+        with open(path, encoding="utf-8", errors="replace") as f:
+            text = f.read()
+    else:
+        return None
+    return text if text and text.strip() else None
+
+
+def chunk_text(text: str, chunk_chars: int = 12000, overlap_chars: int = 500) -> List[str]:
+    """Split text into chunks of at most chunk_chars, preferring paragraph then line breaks."""
+    text = re.sub(r"\n{3,}", "\n\n", text).strip()
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_chars, len(text))
+        if end < len(text):
+            window = text[start:end]
+            for separator in ("\n\n", "\n"):
+                cut = window.rfind(separator)
+                if cut > chunk_chars // 2:
+                    end = start + cut
+                    break
+        chunks.append(text[start:end].strip())
+        if end >= len(text):
+            break
+        start = max(end - overlap_chars, start + 1)
+    return [chunk for chunk in chunks if chunk]
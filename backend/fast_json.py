@@ -0,0 +1,79 @@
+import gzip
+from functools import lru_cache
+from typing import Awaitable, Callable, Optional, Type
+
+import orjson
+from pydantic import BaseModel
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+
+
+@lru_cache(maxsize=None)
+def model_defaults(model: Type[BaseModel]) -> dict:
+    """Values pydantic would fill in for optional fields missing from a stored document."""
+    return {
+        name: field.default
+        for name, field in model.model_fields.items()
+        if not field.is_required() and field.default_factory is None
+    }
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick br or gzip from an Accept-Encoding header, honouring q=0."""
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        coding, *params = part.split(";")
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted.add(coding.strip().lower())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+async def document_list_response(
+    documents: list,
+    model: Type[BaseModel],
+    accept_encoding: Optional[str] = None,
+    headers: Optional[dict] = None,
+    min_compress_bytes: int = 16 * 1024,
+    offload: Optional[Callable[..., Awaitable[bytes]]] = None
+) -> Response:
+    """Serialize raw Mongo documents (projected to the model's fields, without _id) straight to JSON.
+
+    Bypasses pydantic: the output matches what the model would produce for
+    the same documents, since missing optional fields get their defaults
+    and orjson writes naive datetimes in the same ISO format. Compression
+    goes through ``offload(size, func, *args)`` when one is given.
+    """
+    defaults = model_defaults(model)
+    body = orjson.dumps([{**defaults, **document} for document in documents], default=str)
+    headers = dict(headers or {})
+    headers["Vary"] = "Accept-Encoding"
+    encoding = choose_encoding(accept_encoding) if len(body) >= min_compress_bytes else None
+    if encoding:
+        body = await offload(len(body), compress, body, encoding) if offload else compress(body, encoding)
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
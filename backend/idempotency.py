@@ -0,0 +1,127 @@
+import asyncio
+import hashlib
+import json
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional, Tuple
+
+from starlette.responses import Response
+
+# Headers recomputed when a stored response is replayed
+SKIPPED_HEADERS = {"content-length", "content-type"}
+
+
+class IdempotencyConflict(Exception):
+    pass
+
+
+def payload_fingerprint(payload: dict) -> str:
+    """Stable hash of a request body (module level so it can run on a process pool)."""
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class IdempotentRequests:
+    """Runs each logical request once: duplicates share the in-flight call or replay its stored response.
+
+    Requests with an ``Idempotency-Key`` are keyed on it; the finished
+    response is kept in ``collection`` (TTL indexed on ``expires_at``) and
+    replayed for ``ttl`` seconds, and reusing the key for a different
+    payload raises IdempotencyConflict. Concurrent requests with the same
+    payload fingerprint share one call whatever keys they carry; each key
+    gets the shared response stored under it. Without a key, a payload is
+    only coalesced while in flight, so a message deliberately sent twice
+    still gets two answers. Failures are
+    not stored, so a retry after an error runs again. In-flight sharing is
+    per process; stored replays work across processes.
+    """
+
+    def __init__(self, collection, ttl: float = 600.0):
+        self.collection = collection
+        self.ttl = ttl
+        self._inflight = {}
+        self.executed = 0
+        self.coalesced = 0
+        self.replayed = 0
+        self.conflicts = 0
+
+    async def run(
+        self,
+        scope: str,
+        idempotency_key: Optional[str],
+        fingerprint: str,
+        handler: Callable[[], Awaitable[Response]]
+    ) -> Tuple[Response, bool]:
+        """Return (response, shared); shared is True when another request did the work."""
+        key = f"{scope}:key:{idempotency_key}" if idempotency_key else None
+        payload_key = f"{scope}:payload:{fingerprint}"
+
+        if key:
+            stored = await self.collection.find_one({"_id": key})
+            # The TTL monitor runs about once a minute, so check expiry here too
+            if stored and stored["expires_at"] > datetime.utcnow():
+                self._check_fingerprint(stored["fingerprint"], fingerprint)
+                self.replayed += 1
+                return self._replay(stored), True
+            if key in self._inflight:
+                inflight_fingerprint, future = self._inflight[key]
+                self._check_fingerprint(inflight_fingerprint, fingerprint)
+                self.coalesced += 1
+                return self._replay(await asyncio.shield(future)), True
+
+        # The same payload in flight under another key (or none), e.g. a double-click
+        if payload_key in self._inflight:
+            _, future = self._inflight[payload_key]
+            self.coalesced += 1
+            record = await asyncio.shield(future)
+            if key:
+                await self._store(key, record)
+            return self._replay(record), True
+
+        future = asyncio.ensure_future(self._execute(key, fingerprint, handler))
+        for inflight_key in filter(None, (key, payload_key)):
+            self._inflight[inflight_key] = (fingerprint, future)
+            future.add_done_callback(lambda _, inflight_key=inflight_key: self._inflight.pop(inflight_key, None))
+        return self._replay(await asyncio.shield(future)), False
+
+    def _check_fingerprint(self, expected: str, fingerprint: str) -> None:
+        if expected != fingerprint:
+            self.conflicts += 1
+            raise IdempotencyConflict("Idempotency-Key was already used with a different request body")
+
+    async def _execute(self, key: Optional[str], fingerprint: str, handler: Callable[[], Awaitable[Response]]) -> dict:
+        response = await handler()
+        self.executed += 1
+        record = {
+            "fingerprint": fingerprint,
+            "status_code": response.status_code,
+            "body": bytes(response.body),
+            "media_type": response.media_type,
+            "headers": {
+                name: value for name, value in response.headers.items() if name not in SKIPPED_HEADERS
+            },
+            "expires_at": datetime.utcnow() + timedelta(seconds=self.ttl)
+        }
+        if key:
+            await self._store(key, record)
+        return record
+
+    async def _store(self, key: str, record: dict) -> None:
+        await self.collection.replace_one({"_id": key}, record, upsert=True)
+
+    @staticmethod
+    def _replay(record: dict) -> Response:
+        return Response(
+            content=record["body"],
+            status_code=record["status_code"],
+            media_type=record["media_type"],
+            headers=record["headers"]
+        )
+
+    def stats(self) -> dict:
+        return {
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+            "replayed": self.replayed,
+            "conflicts": self.conflicts,
+            "in_flight": len({future for _, future in self._inflight.values()})
+        }
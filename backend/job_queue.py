@@ -0,0 +1,89 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class JobQueue:
+    """Bounded in-process queue drained by a fixed pool of worker tasks."""
+
+    def __init__(self, max_concurrency: int = 4, max_queue_size: int = 100):
+        self.max_concurrency = max_concurrency
+        self.max_queue_size = max_queue_size
+        self._queue = asyncio.Queue(maxsize=max_queue_size)
+        self._workers = []
+        self._changed: Dict[str, asyncio.Event] = {}
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def submit(self, job_id: str, handler: Callable[[], Awaitable[None]]) -> None:
+        """Queue a job; raises JobQueueFull instead of waiting when the queue is at capacity."""
+        try:
+            self._queue.put_nowait((job_id, handler))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise JobQueueFull(f"Job queue is full ({self.max_queue_size} jobs waiting)")
+
+    async def _worker(self) -> None:
+        while True:
+            job_id, handler = await self._queue.get()
+            self.running += 1
+            try:
+                await handler()
+                self.completed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Job {job_id} failed: {str(e)}")
+            finally:
+                self.running -= 1
+                self._queue.task_done()
+                self.notify(job_id)
+
+    def start(self) -> None:
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.max_concurrency)]
+
+    async def stop(self) -> List[str]:
+        """Cancel the workers; returns the ids of queued jobs that will now never run."""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        abandoned = []
+        while not self._queue.empty():
+            job_id, _ = self._queue.get_nowait()
+            self._queue.task_done()
+            abandoned.append(job_id)
+        return abandoned
+
+    def notify(self, job_id: str) -> None:
+        """Wake anyone waiting on this job's progress."""
+        event = self._changed.pop(job_id, None)
+        if event is not None:
+            event.set()
+
+    async def wait_for_change(self, job_id: str, timeout: float) -> None:
+        """Return when the job is next updated in this process, or after timeout."""
+        event = self._changed.setdefault(job_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "max_concurrency": self.max_concurrency,
+            "max_queue_size": self.max_queue_size
+        }
@@ -0,0 +1,255 @@
+import asyncio
+import random
+import re
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Message fallbacks for SDKs that raise plain exceptions; whole tokens only, so
+# "15000 tokens" or "5041234 bytes" are not mistaken for status codes
+THROTTLE_PATTERN = re.compile(r"\b429\b|\brate[ _-]?limit|\bresource[ _]exhausted\b|\btoo many requests\b")
+TRANSIENT_PATTERN = re.compile(r"\b5\d\d\b|\btimed out\b|\btimeout\b|\bunavailable\b|\boverloaded\b")
+
+
+def error_status_code(error: Exception) -> Optional[int]:
+    """HTTP status carried by the exception or its response, if any."""
+    for source in (error, getattr(error, "response", None)):
+        for attribute in ("status_code", "status"):
+            value = getattr(source, attribute, None)
+            if isinstance(value, int):
+                return value
+    return None
+
+
+def is_throttle_error(error: Exception) -> bool:
+    status_code = error_status_code(error)
+    if status_code is not None:
+        return status_code == 429
+    return bool(THROTTLE_PATTERN.search(str(error).lower()))
+
+
+def is_transient_error(error: Exception) -> bool:
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    status_code = error_status_code(error)
+    if status_code is not None:
+        return status_code >= 500 or status_code == 408
+    return bool(TRANSIENT_PATTERN.search(str(error).lower()))
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"LLM provider unavailable, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class LlmThrottledError(Exception):
+    pass
+
+
+class TokenBucket:
+    """Refills rate_per_minute units per minute up to one minute's worth."""
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = rate_per_minute
+        self.rate = rate_per_minute / 60.0
+        self.tokens = rate_per_minute
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            self._refill()
+            while self.tokens < amount:
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= amount
+
+    def consume(self, amount: float) -> None:
+        """Charge usage discovered after the call; may drive the bucket negative."""
+        self._refill()
+        self.tokens -= amount
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit: grows by about one per window of successes, halves on throttling or slow calls."""
+
+    def __init__(self, initial: int, minimum: int, maximum: int, target_latency: float):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.in_flight = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, latency: Optional[float], throttled: bool) -> None:
+        async with self._condition:
+            self.in_flight -= 1
+            if throttled or (latency is not None and latency > self.target_latency):
+                self.limit = max(self.minimum, self.limit / 2)
+            elif latency is not None:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+class CircuitBreaker:
+    """Opens after failure_threshold consecutive failures; lets one trial call through after reset_seconds."""
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def before_call(self) -> None:
+        state = self.state
+        if state == "open":
+            raise CircuitOpenError(self.reset_seconds - (time.monotonic() - self.opened_at))
+        if state == "half_open" and self._trial_running:
+            # The trial call decides the state shortly; have callers back off briefly
+            raise CircuitOpenError(1.0)
+        if state == "half_open":
+            self._trial_running = True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    def abandon_trial(self) -> None:
+        self._trial_running = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._trial_running = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class LlmGovernor:
+    """Shared gate for outbound LLM calls: rate limits, adaptive concurrency, retries and a circuit breaker."""
+
+    def __init__(
+        self,
+        requests_per_minute: float = 300,
+        tokens_per_minute: float = 1_000_000,
+        max_concurrency: int = 16,
+        min_concurrency: int = 1,
+        target_latency: float = 20.0,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_cap: float = 20.0,
+        failure_threshold: int = 5,
+        reset_seconds: float = 30.0
+    ):
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.limiter = AdaptiveLimiter(max_concurrency, min_concurrency, max_concurrency, target_latency)
+        self.breaker = CircuitBreaker(failure_threshold, reset_seconds)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.calls = 0
+        self.retries = 0
+        self.throttled = 0
+        self.failures = 0
+        self.rejected = 0
+
+    @asynccontextmanager
+    async def guard(self, estimated_tokens: int = 0):
+        """Admit one call (no retries); the body's outcome feeds the limiter and breaker."""
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            self.rejected += 1
+            raise
+        try:
+            await self.request_bucket.acquire(1)
+            await self.token_bucket.acquire(estimated_tokens)
+            await self.limiter.acquire()
+        except BaseException:
+            # Cancelled while waiting for capacity: free the half-open trial slot for the next caller
+            self.breaker.abandon_trial()
+            raise
+        started = time.monotonic()
+        self.calls += 1
+        try:
+            yield
+        except Exception as e:
+            throttled = is_throttle_error(e)
+            if throttled:
+                self.throttled += 1
+            else:
+                self.failures += 1
+            if throttled or is_transient_error(e):
+                self.breaker.record_failure()
+            else:
+                # The provider answered; the request itself was bad
+                self.breaker.record_success()
+            await self.limiter.release(None, throttled)
+            raise
+        except BaseException:
+            self.breaker.abandon_trial()
+            await self.limiter.release(None, False)
+            raise
+        self.breaker.record_success()
+        await self.limiter.release(time.monotonic() - started, False)
+
+    async def call(self, send: Callable[[], Awaitable[T]], estimated_tokens: int = 0) -> T:
+        """Run send() under the governor, retrying throttled/transient failures with full-jitter backoff."""
+        attempt = 0
+        while True:
+            try:
+                async with self.guard(estimated_tokens):
+                    result = await send()
+                if isinstance(result, str):
+                    # Charge the response against the tokens/min budget
+                    self.token_bucket.consume(len(result) // 4)
+                return result
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                throttled = is_throttle_error(e)
+                if attempt >= self.max_retries or not (throttled or is_transient_error(e)):
+                    if throttled:
+                        raise LlmThrottledError(f"LLM provider throttled the request: {str(e)}") from e
+                    raise
+                attempt += 1
+                self.retries += 1
+                await asyncio.sleep(random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt)))
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "concurrency_limit": round(self.limiter.limit, 2),
+            "in_flight": self.limiter.in_flight,
+            "circuit": self.breaker.state,
+            "request_tokens_available": round(self.request_bucket.tokens, 1),
+            "llm_tokens_available": round(self.token_bucket.tokens, 1)
+        }
@@ -0,0 +1,200 @@
+import asyncio
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; images are then sent as uploaded
+    Image = None
+
+FFMPEG = shutil.which("ffmpeg")
+
+# MIME types the normalized outputs are written as
+IMAGE_JPEG = "image/jpeg"
+IMAGE_PNG = "image/png"
+AUDIO_OUTPUT = "audio/aac"
+VIDEO_OUTPUT = "video/mp4"
+
+
+def media_kind(content_type: Optional[str]) -> Optional[str]:
+    major = (content_type or "").split("/")[0].lower()
+    return major if major in ("image", "audio", "video") else None
+
+
+def normalize_image(source: str, target: str, max_pixels: int, quality: int) -> str:
+    """Downscale to max_pixels on the long side and re-encode; returns the new MIME type."""
+    with Image.open(source) as image:
+        # JPEG can decode at a reduced scale directly, much cheaper than resampling a full 12MP frame
+        image.draft("RGB", (max_pixels, max_pixels))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_pixels, max_pixels))
+        has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+        if has_alpha:
+            image.save(target, format="PNG", optimize=True)
+            return IMAGE_PNG
+        image.convert("RGB").save(target, format="JPEG", quality=quality, optimize=True)
+        return IMAGE_JPEG
+
+
+def _run_ffmpeg(arguments: list, timeout: float) -> None:
+    subprocess.run(
+        [FFMPEG, "-hide_banner", "-loglevel", "error", "-y", *arguments],
+        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=timeout
+    )
+
+
+def normalize_audio(source: str, target: str, max_seconds: int, sample_rate: int, timeout: float) -> str:
+    """Trim to max_seconds and downsample to mono AAC."""
+    _run_ffmpeg([
+        "-i", source, "-t", str(max_seconds), "-vn", "-ac", "1", "-ar", str(sample_rate),
+        "-c:a", "aac", "-b:a", "48k", "-f", "adts", target
+    ], timeout)
+    return AUDIO_OUTPUT
+
+
+def normalize_video(source: str, target: str, max_seconds: int, max_pixels: int, fps: int, timeout: float) -> str:
+    """Trim to max_seconds, scale the long side to max_pixels, drop the frame rate and re-encode as H.264."""
+    scale = f"scale='if(gt(iw,ih),min({max_pixels},iw),-2)':'if(gt(iw,ih),-2,min({max_pixels},ih))'"
+    _run_ffmpeg([
+        "-i", source, "-t", str(max_seconds), "-vf", f"{scale},fps={fps}",
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", "28",
+        "-c:a", "aac", "-ac", "1", "-b:a", "48k", "-movflags", "+faststart", target
+    ], timeout)
+    return VIDEO_OUTPUT
+
+
+class MediaNormalizer:
+    """Shrinks image, audio and video attachments before they are sent to the model.
+
+    Work runs on a dedicated thread pool (Pillow releases the GIL while
+    resampling; ffmpeg runs as a child process). Results are stored in the
+    blob store and remembered per source hash and settings in ``blobs``, so
+    each file is normalized once. Formats that cannot be handled here are
+    passed through unchanged.
+    """
+
+    def __init__(
+        self,
+        blob_store,
+        blobs_collection,
+        workers: int = 2,
+        max_image_pixels: int = 1600,
+        image_quality: int = 85,
+        max_audio_seconds: int = 300,
+        audio_sample_rate: int = 16000,
+        max_video_seconds: int = 60,
+        max_video_pixels: int = 720,
+        video_fps: int = 5,
+        ffmpeg_timeout: float = 300.0
+    ):
+        self.blob_store = blob_store
+        self.blobs = blobs_collection
+        self.max_image_pixels = max_image_pixels
+        self.image_quality = image_quality
+        self.max_audio_seconds = max_audio_seconds
+        self.audio_sample_rate = audio_sample_rate
+        self.max_video_seconds = max_video_seconds
+        self.max_video_pixels = max_video_pixels
+        self.video_fps = video_fps
+        self.ffmpeg_timeout = ffmpeg_timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="media")
+        self._inflight = {}
+        self.normalized = 0
+        self.reused = 0
+        self.passed_through = 0
+        self.failed = 0
+
+    def profile(self, kind: str) -> str:
+        """Key naming the settings a variant was produced with."""
+        if kind == "image":
+            return f"image-{self.max_image_pixels}-q{self.image_quality}"
+        if kind == "audio":
+            return f"audio-{self.max_audio_seconds}s-{self.audio_sample_rate}hz"
+        return f"video-{self.max_video_seconds}s-{self.max_video_pixels}p-{self.video_fps}fps"
+
+    def supports(self, kind: Optional[str]) -> bool:
+        if kind == "image":
+            return Image is not None
+        return kind in ("audio", "video") and FFMPEG is not None
+
+    async def prepare(self, file_hash: str, content_type: Optional[str]) -> Tuple[str, Optional[str]]:
+        """Return (hash, MIME type) of the file to send to the model for this attachment."""
+        kind = media_kind(content_type)
+        if not self.supports(kind):
+            return file_hash, content_type
+        profile = self.profile(kind)
+
+        blob = await self.blobs.find_one({"hash": file_hash}, {"_id": 0, f"variants.{profile}": 1})
+        variant = ((blob or {}).get("variants") or {}).get(profile)
+        if variant:
+            self.reused += 1
+            return variant["hash"], variant["content_type"]
+
+        key = (file_hash, profile)
+        if key not in self._inflight:
+            self._inflight[key] = asyncio.ensure_future(self._normalize(file_hash, content_type, kind, profile))
+            self._inflight[key].add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(self._inflight[key])
+
+    def _convert(self, source: str, target: str, kind: str) -> str:
+        if kind == "image":
+            return normalize_image(source, target, self.max_image_pixels, self.image_quality)
+        if kind == "audio":
+            return normalize_audio(source, target, self.max_audio_seconds, self.audio_sample_rate, self.ffmpeg_timeout)
+        return normalize_video(
+            source, target, self.max_video_seconds, self.max_video_pixels, self.video_fps, self.ffmpeg_timeout
+        )
+
+    def _convert_to_bytes(self, source: str, kind: str) -> Tuple[bytes, str]:
+        # ffmpeg picks the video container from the extension
+        handle, target = tempfile.mkstemp(prefix="sada-media-", suffix=".mp4" if kind == "video" else "")
+        os.close(handle)
+        try:
+            content_type = self._convert(source, target, kind)
+            with open(target, "rb") as f:
+                return f.read(), content_type
+        finally:
+            os.unlink(target)
+
+    async def _normalize(self, file_hash: str, content_type: str, kind: str, profile: str) -> Tuple[str, str]:
+        source = str(self.blob_store.path_for(file_hash))
+        loop = asyncio.get_running_loop()
+        try:
+            data, new_type = await loop.run_in_executor(self._executor, self._convert_to_bytes, source, kind)
+        except Exception:
+            # Unreadable or unsupported input: send the original this time, try again next time
+            self.failed += 1
+            return file_hash, content_type
+
+        if len(data) >= self.blob_store.size(file_hash):
+            # Already small enough; remember that so it is not re-encoded again
+            self.passed_through += 1
+            variant = {"hash": file_hash, "content_type": content_type}
+        else:
+            self.normalized += 1
+            variant = {"hash": await self.blob_store.put_bytes(data), "content_type": new_type}
+            await self.blobs.update_one(
+                {"hash": variant["hash"]},
+                {"$setOnInsert": {"hash": variant["hash"], "size": len(data), "content_type": new_type, "derived_from": file_hash}},
+                upsert=True
+            )
+        await self.blobs.update_one({"hash": file_hash}, {"$set": {f"variants.{profile}": variant}})
+        return variant["hash"], variant["content_type"]
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        return {
+            "normalized": self.normalized,
+            "reused": self.reused,
+            "passed_through": self.passed_through,
+            "failed": self.failed,
+            "in_progress": len(self._inflight),
+            "images": Image is not None,
+            "audio_video": FFMPEG is not None
+        }
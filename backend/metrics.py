@@ -0,0 +1,159 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from pymongo import monitoring
+from starlette.routing import Match
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+SIZE_BUCKETS = tuple(1024 * 4 ** power for power in range(11))  # 1 KB .. 1 GB
+
+HTTP_REQUESTS = Counter(
+    "sada_http_requests_total", "HTTP requests handled", ["method", "route", "status"]
+)
+HTTP_LATENCY = Histogram(
+    "sada_http_request_duration_seconds", "Time until the last response byte was sent",
+    ["method", "route"], buckets=LATENCY_BUCKETS
+)
+HTTP_IN_FLIGHT = Gauge(
+    "sada_http_requests_in_flight", "Requests currently being handled", ["method", "route"]
+)
+STAGE_LATENCY = Histogram(
+    "sada_stage_duration_seconds", "Time spent in one stage of an operation",
+    ["operation", "stage"], buckets=LATENCY_BUCKETS
+)
+PAYLOAD_BYTES = Histogram(
+    "sada_payload_bytes", "Size of uploaded files and attachments", ["kind"], buckets=SIZE_BUCKETS
+)
+LLM_TOKENS = Counter(
+    "sada_llm_tokens_total", "Estimated LLM tokens (about 4 characters each)", ["direction"]
+)
+MONGO_LATENCY = Histogram(
+    "sada_mongo_command_duration_seconds", "MongoDB command round-trip time",
+    ["command", "collection"], buckets=LATENCY_BUCKETS
+)
+MONGO_FAILURES = Counter(
+    "sada_mongo_command_failures_total", "MongoDB commands that failed", ["command", "collection"]
+)
+
+EVENT_LOOP_LAG = Histogram(
+    "sada_event_loop_lag_seconds", "How late the event loop woke a sleeping task",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+OFFLOAD_IN_FLIGHT = Gauge("sada_offload_in_flight", "CPU-heavy calls running or waiting on the worker pool")
+OFFLOAD_QUEUE_DEPTH = Gauge("sada_offload_queue_depth", "CPU-heavy calls waiting for a free worker")
+
+# Operation that stage timings are attributed to: the endpoint name, set by MetricsMiddleware
+current_operation: ContextVar[str] = ContextVar("current_operation", default="background")
+
+# Connection handshakes and heartbeats, not application queries
+IGNORED_COMMANDS = {"hello", "ismaster", "isMaster", "ping", "saslStart", "saslContinue", "endSessions", "buildInfo"}
+
+
+async def as_background(coro):
+    """Run coro with its stage timings attributed to "background" rather than the spawning request."""
+    current_operation.set("background")
+    return await coro
+
+
+@contextmanager
+def stage(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.labels(current_operation.get(), name).observe(time.perf_counter() - started)
+
+
+def observe_payload(kind: str, size: int) -> None:
+    PAYLOAD_BYTES.labels(kind).observe(size)
+
+
+def count_llm_tokens(prompt_tokens: int, completion_tokens: int = 0) -> None:
+    LLM_TOKENS.labels("prompt").inc(prompt_tokens)
+    if completion_tokens:
+        LLM_TOKENS.labels("completion").inc(completion_tokens)
+
+
+def render() -> tuple:
+    """Return (body, content type) in the Prometheus text format."""
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Records per-command latency; pass an instance to the client's event_listeners."""
+
+    def __init__(self):
+        self._collections = {}
+
+    @staticmethod
+    def _key(event):
+        return event.connection_id, event.request_id
+
+    def started(self, event) -> None:
+        if event.command_name in IGNORED_COMMANDS:
+            return
+        collection = event.command.get(event.command_name)
+        self._collections[self._key(event)] = collection if isinstance(collection, str) else ""
+
+    def _finish(self, event) -> Optional[str]:
+        return self._collections.pop(self._key(event), None)
+
+    def succeeded(self, event) -> None:
+        collection = self._finish(event)
+        if collection is not None:
+            MONGO_LATENCY.labels(event.command_name, collection).observe(event.duration_micros / 1e6)
+
+    def failed(self, event) -> None:
+        collection = self._finish(event)
+        if collection is not None:
+            MONGO_FAILURES.labels(event.command_name, collection).inc()
+            MONGO_LATENCY.labels(event.command_name, collection).observe(event.duration_micros / 1e6)
+
+
+class MetricsMiddleware:
+    """ASGI middleware counting requests and timing them per route template.
+
+    Routes are labelled by their path template (``/api/jobs/{job_id}``), never
+    the raw URL, so label cardinality stays bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    @staticmethod
+    def _route(scope) -> tuple:
+        """(path template, endpoint name) of the route that will handle the request."""
+        for route in scope["app"].router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(route, "path", "unmatched"), getattr(route, "name", "unmatched")
+        return "unmatched", "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route, endpoint = self._route(scope)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        in_flight = HTTP_IN_FLIGHT.labels(method, route)
+        in_flight.inc()
+        token = current_operation.set(endpoint)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_operation.reset(token)
+            in_flight.dec()
+            HTTP_LATENCY.labels(method, route).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(method, route, str(status["code"])).inc()
@@ -0,0 +1,127 @@
+import asyncio
+import base64
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def b64encode_text(data: bytes) -> str:
+    # Module level so a process pool can pickle it
+    return base64.b64encode(data).decode("utf-8")
+
+
+class CpuOffloader:
+    """Runs CPU-heavy calls on a worker pool once their input is large enough to stall the event loop.
+
+    Small inputs run inline, where a pool round trip would cost more than
+    the work. ``kind="process"`` sidesteps the GIL for C functions that hold
+    it (base64, orjson) at the price of pickling arguments and results;
+    ``"thread"`` is cheaper and enough for code that releases the GIL
+    (zlib, hashlib, Pillow). Process-pool callables must be module-level.
+    """
+
+    def __init__(self, kind: str = "thread", workers: Optional[int] = None, threshold_bytes: int = 256 * 1024):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Executor kind must be 'thread' or 'process', not {kind!r}")
+        self.kind = kind
+        self.workers = workers or os.cpu_count() or 1
+        self.threshold_bytes = threshold_bytes
+        if kind == "process":
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="cpu")
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.inline = 0
+        self.offloaded = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """Calls waiting for a free worker."""
+        return max(0, self.in_flight - self.workers)
+
+    async def run(self, size: int, func: Callable, *args):
+        """Call func(*args), on the pool when size (bytes of input) reaches the threshold."""
+        if size < self.threshold_bytes:
+            self.inline += 1
+            return func(*args)
+        self.offloaded += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self.in_flight -= 1
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "threshold_bytes": self.threshold_bytes,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "max_in_flight": self.max_in_flight,
+            "inline": self.inline,
+            "offloaded": self.offloaded
+        }
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes a sleeping task; logs when the loop was blocked."""
+
+    def __init__(
+        self,
+        interval: float = 0.5,
+        warn_after: float = 0.1,
+        on_sample: Optional[Callable[[float], None]] = None
+    ):
+        self.interval = interval
+        self.warn_after = warn_after
+        self.on_sample = on_sample
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - started - self.interval)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            if self.on_sample is not None:
+                self.on_sample(lag)
+            if lag >= self.warn_after:
+                self.stalls += 1
+                logger.warning(f"Event loop was blocked for {lag * 1000:.0f} ms")
+
+    def stats(self) -> dict:
+        return {
+            "interval_seconds": self.interval,
+            "last_lag_ms": round(self.last_lag * 1000, 1),
+            "max_lag_ms": round(self.max_lag * 1000, 1),
+            "stalls": self.stalls,
+            "warn_after_ms": round(self.warn_after * 1000, 1)
+        }
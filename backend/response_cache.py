@@ -0,0 +1,88 @@
+import hashlib
+from collections import OrderedDict
+from typing import Optional
+
+from pymongo import UpdateOne
+
+
+class ResourceVersions:
+    """Per-resource change counters kept in MongoDB so every server process sees every bump.
+
+    Writers bump a resource only after their write is acknowledged, so a
+    reader that sees version N also sees every write that produced it.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def get(self, key: str) -> int:
+        document = await self.collection.find_one({"_id": key})
+        return document["version"] if document else 0
+
+    async def bump(self, *keys: str) -> None:
+        if not keys:
+            return
+        await self.collection.bulk_write(
+            [UpdateOne({"_id": key}, {"$inc": {"version": 1}}, upsert=True) for key in dict.fromkeys(keys)],
+            ordered=False
+        )
+
+
+def make_etag(version: int, *parts: str) -> str:
+    """Weak ETag for one representation of a resource version (weak, so it survives compression)."""
+    digest = hashlib.blake2b("\0".join(parts).encode("utf-8"), digest_size=8).hexdigest()
+    return f'W/"{version}-{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {candidate.strip() for candidate in if_none_match.split(",")}
+    # Weak comparison: W/"x" and "x" name the same representation
+    return "*" in candidates or etag in candidates or etag[2:] in candidates
+
+
+class ResponseCache:
+    """LRU of serialized response bodies bounded by total size.
+
+    Keys include the resource version, so a write invalidates every cached
+    page of that resource just by bumping it; stale entries age out.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key) -> Optional[tuple]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def set(self, key, body: bytes, headers: dict) -> None:
+        if len(body) > self.max_bytes:
+            return
+        if key in self._entries:
+            self.used_bytes -= len(self._entries.pop(key)[0])
+        self._entries[key] = (body, headers)
+        self.used_bytes += len(body)
+        while self.used_bytes > self.max_bytes:
+            _, (evicted, _) = self._entries.popitem(last=False)
+            self.used_bytes -= len(evicted)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "used_bytes": self.used_bytes,
+            "max_bytes": self.max_bytes
+        }
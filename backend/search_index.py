@@ -0,0 +1,272 @@
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional, Union
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, the single-writer rule is on the operator
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]{2,}")
+INITIAL_CAPACITY = 1024
+
+
+def tokenize(text: str) -> List[str]:
+    words = TOKEN_PATTERN.findall(text.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class SearchIndexLocked(RuntimeError):
+    """Another process already owns the index directory."""
+
+
+class SearchIndex:
+    """Hashed TF-IDF vectors in a memory-mapped file, searched by brute-force cosine similarity.
+
+    Rows are appended as records are indexed; ``meta.jsonl`` maps each row
+    back to its record and ``cursors.json`` keeps how far each source has
+    been read. One process owns a directory at a time: opening it
+    takes an exclusive lock on ``writer.lock`` and raises SearchIndexLocked
+    if another process holds it. Methods are thread-safe, so callers on an
+    event loop can run them with ``asyncio.to_thread``.
+    """
+
+    def __init__(self, directory: Union[str, Path], dim: int = 1024, flush_every: int = 64):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock_file = self._acquire_directory()
+        self._lock = threading.Lock()
+        self.dim = dim
+        self.flush_every = flush_every
+        self._vectors_path = self.directory / "vectors.f32"
+        self._meta_path = self.directory / "meta.jsonl"
+        self._df_path = self.directory / "df.npy"
+        self._cursors_path = self.directory / "cursors.json"
+        self._pending = 0
+
+        self.meta = []
+        if self._meta_path.exists():
+            with open(self._meta_path) as f:
+                self.meta = [json.loads(line) for line in f if line.strip()]
+        self.doc_freq = np.load(self._df_path) if self._df_path.exists() else np.zeros(dim, dtype=np.float64)
+        if self.doc_freq.shape != (dim,):
+            raise ValueError(f"Index at {self.directory} was built with a different dimension")
+        self._ids = {(row["kind"], row["id"]) for row in self.meta}
+        self.cursors = json.loads(self._cursors_path.read_text()) if self._cursors_path.exists() else {}
+        self._filter_arrays = None
+        self._open_vectors(max(INITIAL_CAPACITY, len(self.meta)))
+        self._meta_file = open(self._meta_path, "a")
+
+    def _acquire_directory(self):
+        lock_file = open(self.directory / "writer.lock", "w")
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                raise SearchIndexLocked(f"Search index at {self.directory} is in use by another process")
+        return lock_file
+
+    def __len__(self) -> int:
+        return len(self.meta)
+
+    def _open_vectors(self, capacity: int) -> None:
+        """Map the vector file, growing it to at least capacity rows."""
+        if self._vectors_path.exists():
+            capacity = max(capacity, self._vectors_path.stat().st_size // (4 * self.dim))
+        with open(self._vectors_path, "ab") as f:
+            f.truncate(capacity * self.dim * 4)
+        self.vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+
+    def _bucket(self, token: str) -> int:
+        digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "little") % self.dim
+
+    def vectorize(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token in tokenize(text):
+            vector[self._bucket(token)] += 1.0
+        # Sublinear term frequency, L2-normalized
+        np.log1p(vector, out=vector)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def add(self, kind: str, record_id: str, session_id: Optional[str], text: str, snippet: str = "") -> bool:
+        return self.add_many([(kind, record_id, session_id, text, snippet)]) == 1
+
+    def add_many(self, records: list) -> int:
+        """Index (kind, record_id, session_id, text, snippet) tuples; returns how many were new."""
+        added = 0
+        with self._lock:
+            for kind, record_id, session_id, text, snippet in records:
+                if self._append(kind, record_id, session_id, text, snippet or ""):
+                    added += 1
+            if added:
+                self._meta_file.flush()
+                self._filter_arrays = None
+            if self._pending >= self.flush_every:
+                self._flush()
+        return added
+
+    def _append(self, kind: str, record_id: str, session_id: Optional[str], text: str, snippet: str) -> bool:
+        if (kind, record_id) in self._ids or not text.strip():
+            return False
+        vector = self.vectorize(text)
+        row = len(self.meta)
+        if row >= self.vectors.shape[0]:
+            self.vectors.flush()
+            self._open_vectors(self.vectors.shape[0] * 2)
+        self.vectors[row] = vector
+        self.doc_freq += vector > 0
+
+        entry = {"kind": kind, "id": record_id, "session_id": session_id, "snippet": snippet[:300]}
+        self._meta_file.write(json.dumps(entry) + "\n")
+        self.meta.append(entry)
+        self._ids.add((kind, record_id))
+        self._pending += 1
+        return True
+
+    def set_cursor(self, source: str, value: str) -> None:
+        """Remember how far a source has been indexed; saved with the next flush."""
+        with self._lock:
+            self.cursors[source] = value
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        self._meta_file.flush()
+        self.vectors.flush()
+        np.save(self._df_path, self.doc_freq)
+        # Written after the rows it covers, so a crash can only leave it behind them
+        self._cursors_path.write_text(json.dumps(self.cursors))
+        self._pending = 0
+
+    def close(self) -> None:
+        """Flush and release the directory for another process."""
+        with self._lock:
+            self._flush()
+            self._meta_file.close()
+            self._lock_file.close()
+
+    def _filters(self):
+        """(session_id, kind) per row as arrays, rebuilt lazily after inserts."""
+        if self._filter_arrays is None:
+            self._filter_arrays = (
+                np.array([row["session_id"] or "" for row in self.meta], dtype=object),
+                np.array([row["kind"] for row in self.meta], dtype=object)
+            )
+        return self._filter_arrays
+
+    def search(self, query: str, session_id: Optional[str] = None, kind: Optional[str] = None, limit: int = 10) -> list:
+        with self._lock:
+            return self._search(query, session_id, kind, limit)
+
+    def _search(self, query: str, session_id: Optional[str], kind: Optional[str], limit: int) -> list:
+        count = len(self.meta)
+        if count == 0:
+            return []
+        idf = np.log((1 + count) / (1 + self.doc_freq)).astype(np.float32) + 1.0
+        weighted_query = self.vectorize(query) * idf * idf
+        if not weighted_query.any():
+            return []
+
+        scores = self.vectors[:count] @ weighted_query
+        mask = scores > 0
+        if session_id is not None or kind is not None:
+            sessions, kinds = self._filters()
+            if session_id is not None:
+                mask &= sessions == session_id
+            if kind is not None:
+                mask &= kinds == kind
+        candidates = np.flatnonzero(mask)
+        if candidates.size == 0:
+            return []
+
+        top = candidates[np.argsort(-scores[candidates], kind="stable")[:limit]]
+        return [{**self.meta[row], "score": float(scores[row])} for row in top]
+
+
+class SearchIndexWriter:
+    """Feeds a SearchIndex from a bounded queue, indexing batches in a worker thread.
+
+    Tokenizing, hashing and the file writes stay off the event loop; when
+    the queue is full, callers wait instead of growing memory.
+    """
+
+    def __init__(self, index: SearchIndex, max_queue_size: int = 10000, batch_size: int = 256, flush_interval: float = 0.2):
+        self.index = index
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self._task: Optional[asyncio.Task] = None
+        self.indexed = 0
+        self.failed = 0
+
+    async def add(self, kind: str, record_id: str, session_id: Optional[str], text: str, snippet: str = "") -> None:
+        await self._queue.put((kind, record_id, session_id, text, snippet))
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def drain(self) -> None:
+        """Wait until everything queued so far is indexed, then flush to disk."""
+        if self._task is not None:
+            await self._queue.join()
+        await asyncio.to_thread(self.index.flush)
+
+    async def stop(self) -> None:
+        await self.drain()
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _collect(self) -> list:
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._collect()
+            try:
+                self.indexed += await asyncio.to_thread(self.index.add_many, batch)
+            except Exception as e:
+                self.failed += len(batch)
+                logger.error(f"Indexing {len(batch)} search records failed: {str(e)}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def stats(self) -> dict:
+        return {
+            "records": len(self.index),
+            "queued": self._queue.qsize(),
+            "indexed": self.indexed,
+            "failed": self.failed
+        }
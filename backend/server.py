@@ -1,5 +1,6 @@
-from fastapi import FastAPI, APIRouter, File, UploadFile, HTTPException, Form
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, APIRouter, File, UploadFile, HTTPException, Form, Header, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse, JSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
@@ -7,23 +8,127 @@ import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Awaitable, Callable, List, Optional
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 import base64
 import io
 import asyncio
 import json
+import math
+import tempfile
+import zlib
+import orjson
 from emergentintegrations.llm.chat import LlmChat, UserMessage, FileContentWithMimeType
+from blob_store import BlobStore, CHUNK_SIZE
+from spool import SpoolManager, SpoolQuotaExceeded
+from analysis_cache import AnalysisCache
+from db_indexes import ensure_indexes
+from job_queue import JobQueue, JobQueueFull
+from conversation import ConversationContext
+from analysis_parser import parse_analysis_response
+from extraction import extract_text, chunk_text
+from search_index import SearchIndex, SearchIndexLocked, SearchIndexWriter
+from llm_governor import LlmGovernor, CircuitOpenError, LlmThrottledError
+import metrics
+from write_behind import WriteBehindWriter
+from fast_json import document_list_response, choose_encoding
+from response_cache import ResourceVersions, ResponseCache, make_etag, etag_matches
+from media import MediaNormalizer
+from offload import CpuOffloader, LoopLagMonitor, b64encode_text
+from archive import ChatArchive
+from idempotency import IdempotentRequests, IdempotencyConflict, payload_fingerprint
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[metrics.MongoCommandMetrics()])
 db = client[os.environ['DB_NAME']]
 
+# Hashing, base64, compression and text chunking of large payloads run here instead of on the event loop
+cpu_offloader = CpuOffloader(
+    kind=os.environ.get('CPU_EXECUTOR', 'thread'),
+    workers=int(os.environ.get('CPU_WORKERS', '0')) or None,
+    threshold_bytes=int(os.environ.get('CPU_OFFLOAD_THRESHOLD_KB', '256')) * 1024
+)
+metrics.OFFLOAD_IN_FLIGHT.set_function(lambda: cpu_offloader.in_flight)
+metrics.OFFLOAD_QUEUE_DEPTH.set_function(lambda: cpu_offloader.queue_depth)
+
+# Per-request spool files for incoming uploads; point SPOOL_DIR at a tmpfs such as /dev/shm for speed
+spool_manager = SpoolManager(
+    os.environ.get('SPOOL_DIR', str(Path(tempfile.gettempdir()) / 'sada_spool')),
+    quota_bytes=int(os.environ.get('SPOOL_QUOTA_MB', '1024')) * 1024 * 1024,
+    run_cpu=cpu_offloader.run
+)
+
+# Content-addressed storage for uploaded files
+blob_store = BlobStore(
+    os.environ.get('BLOB_STORE_DIR', str(ROOT_DIR / 'blob_store')), spool_manager, run_cpu=cpu_offloader.run
+)
+
+# Logs whenever something blocks the event loop for longer than EVENT_LOOP_WARN_MS
+loop_lag_monitor = LoopLagMonitor(
+    interval=float(os.environ.get('EVENT_LOOP_CHECK_MS', '500')) / 1000,
+    warn_after=float(os.environ.get('EVENT_LOOP_WARN_MS', '100')) / 1000,
+    on_sample=metrics.EVENT_LOOP_LAG.observe
+)
+
+# Images, audio and video are downsized before upload to the model; variants are cached per source hash
+media_normalizer = MediaNormalizer(
+    blob_store,
+    db.blobs,
+    workers=int(os.environ.get('MEDIA_WORKERS', '2')),
+    max_image_pixels=int(os.environ.get('MEDIA_MAX_IMAGE_PIXELS', '1600')),
+    image_quality=int(os.environ.get('MEDIA_IMAGE_QUALITY', '85')),
+    max_audio_seconds=int(os.environ.get('MEDIA_MAX_AUDIO_SECONDS', '300')),
+    max_video_seconds=int(os.environ.get('MEDIA_MAX_VIDEO_SECONDS', '60')),
+    max_video_pixels=int(os.environ.get('MEDIA_MAX_VIDEO_PIXELS', '720')),
+    video_fps=int(os.environ.get('MEDIA_VIDEO_FPS', '5'))
+)
+
+# Background workers for ?async=1 analysis jobs
+job_queue = JobQueue(
+    max_concurrency=int(os.environ.get('ANALYSIS_JOB_WORKERS', '4')),
+    max_queue_size=int(os.environ.get('ANALYSIS_JOB_QUEUE_SIZE', '100'))
+)
+job_watcher_tasks = []
+
+# Local vector index over analyses and chat answers for /api/search.
+# The index directory has a single owner, which indexes what every worker stores
+# by following the collections; other worker processes serve without search.
+try:
+    search_index = SearchIndex(
+        os.environ.get('SEARCH_INDEX_DIR', str(ROOT_DIR / 'search_index')),
+        dim=int(os.environ.get('SEARCH_INDEX_DIM', '1024'))
+    )
+    search_writer = SearchIndexWriter(search_index)
+except SearchIndexLocked as e:
+    logging.getLogger(__name__).warning(f"Search disabled in this process: {str(e)}")
+    search_index = None
+    search_writer = None
+SEARCH_INDEX_POLL_SECONDS = float(os.environ.get('SEARCH_INDEX_POLL_SECONDS', '2'))
+SEARCH_INDEX_OVERLAP_SECONDS = 60
+search_follow_tasks = []
+
+# Analysis results cached by (content hash, analysis type, model, prompt version)
+analysis_cache = AnalysisCache(
+    db.analysis_cache,
+    max_entries=int(os.environ.get('ANALYSIS_CACHE_SIZE', '512')),
+    ttl_seconds=int(os.environ.get('ANALYSIS_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))
+)
+
+# Change counters behind list ETags, and serialized list pages keyed by those counters
+resource_versions = ResourceVersions(db.resource_versions)
+response_cache = ResponseCache(max_bytes=int(os.environ.get('RESPONSE_CACHE_MB', '64')) * 1024 * 1024)
+
+# Duplicate LLM-backed POSTs share one call; responses to keyed requests are replayed for IDEMPOTENCY_TTL_SECONDS
+idempotent_requests = IdempotentRequests(
+    db.idempotency_keys,
+    ttl=float(os.environ.get('IDEMPOTENCY_TTL_SECONDS', '600'))
+)
+
 # Create the main app without a prefix
 app = FastAPI(title="SaDA AI - Smart Document Analysis & Customer Support")
 
@@ -52,7 +157,8 @@ class DocumentAnalysis(BaseModel):
     key_insights: List[str]
     sentiment_score: Optional[float] = None
     entities: List[dict] = []
-    file_content: str  # base64 encoded
+    file_hash: Optional[str] = None  # SHA-256 of the stored blob
+    file_content: Optional[str] = None  # legacy inline base64, not written anymore
     session_id: str
     timestamp: datetime = Field(default_factory=datetime.utcnow)
 
@@ -63,6 +169,22 @@ class DocumentAnalysisCreate(BaseModel):
     analysis_type: str
     file_content: str  # base64 encoded
     session_id: str
+    bypass_cache: bool = False
+
+class AnalysisJob(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    status: str = "queued"  # queued, running, completed, failed
+    filename: str
+    content_type: str
+    file_size: int
+    analysis_type: str
+    session_id: str
+    file_hash: str
+    bypass_cache: bool = False
+    result: Optional[DocumentAnalysis] = None
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
 
 class ChatMessage(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -70,7 +192,8 @@ class ChatMessage(BaseModel):
     user_message: str
     ai_response: str
     message_type: str = "text"  # text, image, audio, video
-    file_content: Optional[str] = None  # base64 encoded
+    file_hash: Optional[str] = None  # SHA-256 of the stored blob
+    file_content: Optional[str] = None  # legacy inline base64, not written anymore
     file_type: Optional[str] = None
     timestamp: datetime = Field(default_factory=datetime.utcnow)
 
@@ -92,6 +215,153 @@ class ChatSessionCreate(BaseModel):
     session_name: str
     session_type: str
 
+def analysis_search_record(analysis: dict) -> tuple:
+    text = "\n".join([analysis.get("summary") or ""] + list(analysis.get("key_insights") or []))
+    return "analysis", analysis["id"], analysis.get("session_id"), text, analysis.get("summary") or ""
+
+def message_search_record(message: dict) -> tuple:
+    ai_response = message.get("ai_response") or ""
+    return "message", message["id"], message.get("session_id"), ai_response, ai_response
+
+def analyses_resources(session_ids) -> List[str]:
+    return ["document_analyses"] + [f"document_analyses:{session_id}" for session_id in session_ids]
+
+def chat_resources(session_ids) -> List[str]:
+    return ["chat_sessions"] + [f"chat_messages:{session_id}" for session_id in session_ids]
+
+async def insert_analyses(analyses: List[dict]) -> None:
+    await db.document_analyses.insert_many(analyses)
+    await resource_versions.bump(*analyses_resources({analysis["session_id"] for analysis in analyses}))
+
+async def record_blob(digest: str, size: int, content_type: Optional[str]) -> None:
+    await db.blobs.update_one(
+        {"hash": digest},
+        {
+            "$setOnInsert": {
+                "hash": digest,
+                "size": size,
+                "content_type": content_type,
+                "created_at": datetime.utcnow()
+            }
+        },
+        upsert=True
+    )
+
+async def store_blob(data: bytes, content_type: Optional[str]) -> str:
+    """Write data to the blob store once and record its metadata; returns the SHA-256 hash."""
+    with metrics.stage("blob_write"):
+        digest = await blob_store.put_bytes(data)
+    with metrics.stage("blob_record"):
+        await record_blob(digest, len(data), content_type)
+    return digest
+
+def parse_range_header(range_header: str, size: int):
+    """Parse a single 'bytes=start-end' range; returns (start, end) or None if unsatisfiable."""
+    if not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    start_str, _, end_str = range_header[len("bytes="):].strip().partition("-")
+    try:
+        if start_str == "":
+            # Suffix range: last N bytes
+            length = int(end_str)
+            if length <= 0:
+                return None
+            return max(size - length, 0), size - 1
+        start = int(start_str)
+        end = int(end_str) if end_str else size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        return None
+    return start, min(end, size - 1)
+
+# Pagination helpers
+MAX_PAGE_SIZE = 1000
+# Attachments are excluded from list responses unless requested with ?include=file_content
+HEAVY_FIELDS = ["file_content"]
+
+# List responses at least this large are gzip/brotli compressed when the client accepts it
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.environ.get('RESPONSE_COMPRESSION_MIN_KB', '16')) * 1024
+
+def list_projection(model, include: Optional[str] = None) -> dict:
+    """Project exactly the model's fields (no _id), leaving out heavy fields unless requested."""
+    requested = {field.strip() for field in include.split(",")} if include else set()
+    projection = {"_id": 0}
+    for field in model.model_fields:
+        if field not in HEAVY_FIELDS or field in requested:
+            projection[field] = 1
+    return projection
+
+def keyset_filter(query: dict, sort_field: str, direction: int, after: Optional[str]) -> dict:
+    """Add the condition for rows strictly after an '<iso timestamp>,<id>' cursor."""
+    if not after:
+        return query
+    timestamp_str, _, last_id = after.partition(",")
+    try:
+        timestamp = datetime.fromisoformat(timestamp_str)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor, expected '<timestamp>,<id>'")
+    op = "$gt" if direction == 1 else "$lt"
+    return {
+        **query,
+        "$or": [
+            {sort_field: {op: timestamp}},
+            {sort_field: timestamp, "id": {op: last_id}}
+        ]
+    }
+
+async def fetch_page(
+    collection,
+    query: dict,
+    sort_field: str,
+    direction: int,
+    after: Optional[str],
+    limit: int,
+    response: Response,
+    projection: Optional[dict] = None
+) -> list:
+    """Fetch one keyset page ordered by (sort_field, id); sets X-Next-Cursor when more rows may follow."""
+    cursor = collection.find(keyset_filter(query, sort_field, direction, after), projection or None)
+    documents = await cursor.sort([(sort_field, direction), ("id", direction)]).limit(limit).to_list(limit)
+    if len(documents) == limit:
+        last = documents[-1]
+        response.headers["X-Next-Cursor"] = f"{last[sort_field].isoformat()},{last['id']}"
+    return documents
+
+async def list_response(documents: list, model, response: Response, accept_encoding: Optional[str]) -> Response:
+    """Fast read path: raw documents go straight to orjson, skipping model construction and response_model validation."""
+    headers = {}
+    if "X-Next-Cursor" in response.headers:
+        headers["X-Next-Cursor"] = response.headers["X-Next-Cursor"]
+    return await document_list_response(
+        documents, model, accept_encoding, headers, RESPONSE_COMPRESSION_MIN_BYTES, offload=cpu_offloader.run
+    )
+
+async def conditional_list_response(
+    request: Request,
+    resource: str,
+    accept_encoding: Optional[str],
+    build: Callable[[], Awaitable[Response]]
+) -> Response:
+    """Serve a list page with an ETag: 304 when the client is current, else from the response cache or build()."""
+    version = await resource_versions.get(resource)
+    etag = make_etag(version, request.url.path, request.url.query)
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    
+    cache_key = (request.url.path, request.url.query, version, choose_encoding(accept_encoding))
+    cached = response_cache.get(cache_key)
+    if cached is None:
+        response = await build()
+        cached = (response.body, {
+            name: response.headers[name]
+            for name in ("X-Next-Cursor", "Content-Encoding") if name in response.headers
+        })
+        response_cache.set(cache_key, *cached)
+    body, cached_headers = cached
+    return Response(content=body, media_type="application/json", headers={**headers, **cached_headers})
+
 # Basic routes
 @api_router.get("/")
 async def root():
@@ -105,9 +375,16 @@ async def create_status_check(input: StatusCheckCreate):
     return status_obj
 
 @api_router.get("/status", response_model=List[StatusCheck])
-async def get_status_checks():
-    status_checks = await db.status_checks.find().to_list(1000)
-    return [StatusCheck(**status_check) for status_check in status_checks]
+async def get_status_checks(
+    response: Response,
+    after: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=MAX_PAGE_SIZE),
+    accept_encoding: Optional[str] = Header(None)
+):
+    status_checks = await fetch_page(
+        db.status_checks, {}, "timestamp", 1, after, limit, response, list_projection(StatusCheck)
+    )
+    return await list_response(status_checks, StatusCheck, response, accept_encoding)
 
 # Chat Session Management
 @api_router.post("/chat/sessions", response_model=ChatSession)
@@ -115,12 +392,24 @@ async def create_chat_session(session_data: ChatSessionCreate):
     session_dict = session_data.dict()
     session_obj = ChatSession(**session_dict)
     await db.chat_sessions.insert_one(session_obj.dict())
+    await resource_versions.bump("chat_sessions")
     return session_obj
 
 @api_router.get("/chat/sessions", response_model=List[ChatSession])
-async def get_chat_sessions():
-    sessions = await db.chat_sessions.find().sort("updated_at", -1).to_list(100)
-    return [ChatSession(**session) for session in sessions]
+async def get_chat_sessions(
+    request: Request,
+    response: Response,
+    after: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    accept_encoding: Optional[str] = Header(None)
+):
+    async def build() -> Response:
+        sessions = await fetch_page(
+            db.chat_sessions, {}, "updated_at", -1, after, limit, response, list_projection(ChatSession)
+        )
+        return await list_response(sessions, ChatSession, response, accept_encoding)
+    
+    return await conditional_list_response(request, "chat_sessions", accept_encoding, build)
 
 @api_router.get("/chat/sessions/{session_id}", response_model=ChatSession)
 async def get_chat_session(session_id: str):
@@ -129,194 +418,1231 @@ async def get_chat_session(session_id: str):
         raise HTTPException(status_code=404, detail="Session not found")
     return ChatSession(**session)
 
-# Document Analysis Endpoints
-@api_router.post("/documents/analyze", response_model=DocumentAnalysis)
-async def analyze_document(document_data: DocumentAnalysisCreate):
+# LLM configuration
+LLM_PROVIDER = "gemini"
+LLM_MODEL = "gemini-2.0-flash"
+# Bump whenever ANALYSIS_PROMPTS or response parsing changes so cached results are not reused
+PROMPT_VERSION = "2"
+
+ANALYZER_SYSTEM_MESSAGE = "You are SaDA AI, an expert document analyzer. Analyze documents thoroughly and provide detailed insights, summaries, and extract key information. Always provide structured responses with clear summaries, key insights, and identify any entities or important data points."
+SUPPORT_SYSTEM_MESSAGE = "You are SaDA AI, an advanced customer support assistant. You can analyze text, images, audio, and video content. Provide helpful, detailed responses and assist with customer inquiries. For product defects or technical issues, analyze any provided media and offer solutions."
+SUMMARIZER_SYSTEM_MESSAGE = "You are SaDA AI's note taker. You maintain short, factual running summaries of customer support conversations."
+
+# Maximum concurrent LLM calls per batch request
+ANALYSIS_BATCH_CONCURRENCY = int(os.environ.get('ANALYSIS_BATCH_CONCURRENCY', '8'))
+
+# Files at least this large are split into text chunks (when we can extract text locally)
+CHUNKED_ANALYSIS_THRESHOLD_BYTES = int(os.environ.get('CHUNKED_ANALYSIS_THRESHOLD_KB', '512')) * 1024
+ANALYSIS_CHUNK_CHARS = int(os.environ.get('ANALYSIS_CHUNK_CHARS', '12000'))
+CHUNK_ANALYSIS_CONCURRENCY = int(os.environ.get('CHUNK_ANALYSIS_CONCURRENCY', '4'))
+
+# How often job progress feeds re-check jobs run by other processes
+JOB_POLL_INTERVAL_SECONDS = 2.0
+# Each process refreshes heartbeat_at on the jobs it owns; unfinished jobs whose heartbeat stops are failed
+JOB_HEARTBEAT_SECONDS = float(os.environ.get('JOB_HEARTBEAT_SECONDS', '15'))
+JOB_STALE_SECONDS = JOB_HEARTBEAT_SECONDS * 4
+ACTIVE_JOB_STATUSES = ["queued", "running"]
+# Marks the jobs queued by this server process
+INSTANCE_ID = str(uuid.uuid4())
+
+ANALYZER_ROLE = "analyzer"
+SUPPORT_ROLE = "support"
+SUMMARIZER_ROLE = "summarizer"
+SYSTEM_MESSAGES = {
+    ANALYZER_ROLE: ANALYZER_SYSTEM_MESSAGE,
+    SUPPORT_ROLE: SUPPORT_SYSTEM_MESSAGE,
+    SUMMARIZER_ROLE: SUMMARIZER_SYSTEM_MESSAGE
+}
+
+def create_llm_chat(session_id: str, role: str) -> LlmChat:
+    # Initialize Gemini chat
+    return LlmChat(
+        api_key=GEMINI_API_KEY,
+        session_id=session_id,
+        system_message=SYSTEM_MESSAGES[role]
+    ).with_model(LLM_PROVIDER, LLM_MODEL)
+
+
+# Every outbound LLM call goes through one governor: provider quotas, adaptive concurrency, retries, circuit breaker
+llm_governor = LlmGovernor(
+    requests_per_minute=float(os.environ.get('LLM_REQUESTS_PER_MINUTE', '300')),
+    tokens_per_minute=float(os.environ.get('LLM_TOKENS_PER_MINUTE', '1000000')),
+    max_concurrency=int(os.environ.get('LLM_MAX_CONCURRENCY', '16')),
+    target_latency=float(os.environ.get('LLM_TARGET_LATENCY_SECONDS', '20')),
+    max_retries=int(os.environ.get('LLM_MAX_RETRIES', '3')),
+    failure_threshold=int(os.environ.get('LLM_BREAKER_FAILURES', '5')),
+    reset_seconds=float(os.environ.get('LLM_BREAKER_RESET_SECONDS', '30'))
+)
+
+# Rough per-attachment token cost; the file itself is never read here
+ATTACHMENT_TOKEN_ESTIMATE = 258
+
+def estimate_message_tokens(user_message: UserMessage) -> int:
+    attachments = getattr(user_message, "file_contents", None) or []
+    return len(user_message.text) // 4 + ATTACHMENT_TOKEN_ESTIMATE * len(attachments)
+
+def llm_unavailable(error: Exception) -> HTTPException:
+    retry_after = error.retry_after if isinstance(error, CircuitOpenError) else llm_governor.breaker.reset_seconds
+    return HTTPException(
+        status_code=503,
+        detail=str(error),
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+    )
+
+async def send_llm_message(chat, user_message: UserMessage) -> str:
+    """Send one message through the governor; 503 with Retry-After when the provider is unavailable."""
+    prompt_tokens = estimate_message_tokens(user_message)
+    try:
+        with metrics.stage("llm"):
+            response = await llm_governor.call(lambda: chat.send_message(user_message), prompt_tokens)
+    except (CircuitOpenError, LlmThrottledError) as e:
+        raise llm_unavailable(e)
+    metrics.count_llm_tokens(prompt_tokens, len(response) // 4)
+    return response
+
+# "strict" acknowledges chat writes before replying; "write_behind" queues them and flushes in batches,
+# trading durability (queued writes are lost on a crash) for latency
+CHAT_WRITE_MODE = os.environ.get('CHAT_WRITE_MODE', 'strict')
+if CHAT_WRITE_MODE not in ("strict", "write_behind"):
+    raise ValueError(f"CHAT_WRITE_MODE must be 'strict' or 'write_behind', not {CHAT_WRITE_MODE!r}")
+async def bump_flushed_chat_versions(batch: list) -> None:
+    session_ids = {document["session_id"] for kind, collection, document, _ in batch if collection == "chat_messages"}
+    await resource_versions.bump(*chat_resources(session_ids))
+
+chat_writer = WriteBehindWriter(
+    db,
+    after_flush=bump_flushed_chat_versions,
+    max_queue_size=int(os.environ.get('CHAT_WRITE_QUEUE_SIZE', '10000')),
+    batch_size=int(os.environ.get('CHAT_WRITE_BATCH_SIZE', '500')),
+    flush_interval=float(os.environ.get('CHAT_WRITE_FLUSH_MS', '200')) / 1000
+)
+
+async def bump_archived_session_versions(session_id: str) -> None:
+    await resource_versions.bump(*chat_resources([session_id]))
+
+# Sessions idle this many days are compacted into compressed bundles in the blob store; 0 (default) disables
+chat_archive = ChatArchive(
+    db.chat_sessions,
+    db.chat_messages,
+    blob_store,
+    store_blob,
+    idle_days=int(os.environ.get('CHAT_ARCHIVE_AFTER_DAYS', '0')),
+    interval=float(os.environ.get('CHAT_COMPACTION_INTERVAL_MINUTES', '60')) * 60,
+    batch_size=int(os.environ.get('CHAT_COMPACTION_BATCH', '50')),
+    level=int(os.environ.get('CHAT_ARCHIVE_ZSTD_LEVEL', '10')),
+    on_change=bump_archived_session_versions,
+    run_cpu=cpu_offloader.run
+)
+
+# Support prompts are assembled from stored history within this budget; 0 leaves history to LlmChat
+conversation_context = ConversationContext(
+    db.chat_messages,
+    db.chat_summaries,
+    budget_tokens=int(os.environ.get('CHAT_CONTEXT_BUDGET_TOKENS', '4000')),
+    summary_every=int(os.environ.get('CHAT_SUMMARY_EVERY', '10'))
+)
+
+def support_chat(session_id: str) -> LlmChat:
+    """The chat client for a support turn."""
+    if conversation_context.enabled:
+        # The prompt already carries the conversation, so use a client with no history of its own
+        return create_llm_chat(f"{session_id}:{uuid.uuid4()}", SUPPORT_ROLE)
+    return create_llm_chat(session_id, SUPPORT_ROLE)
+
+def analysis_chat() -> LlmChat:
+    """A history-free client: chunks and documents must not see earlier ones in their prompts."""
+    return create_llm_chat(f"analysis:{uuid.uuid4()}", ANALYZER_ROLE)
+
+async def build_support_prompt(session_id: str, user_message: str) -> str:
+    if not conversation_context.enabled:
+        return user_message
+    await chat_archive.rehydrate(session_id)
+    return await conversation_context.build_prompt(session_id, user_message)
+
+async def summarize_conversation(session_id: str, prompt: str) -> str:
+    chat = create_llm_chat(f"{session_id}:summary:{uuid.uuid4()}", SUMMARIZER_ROLE)
+    return await send_llm_message(chat, UserMessage(text=prompt))
+
+async def roll_up_conversation(session_id: str) -> None:
+    try:
+        await conversation_context.roll_up(session_id, lambda prompt: summarize_conversation(session_id, prompt))
+    except Exception as e:
+        logger.error(f"Conversation summary error: {str(e)}")
+
+# Analysis prompts based on type
+ANALYSIS_PROMPTS = {
+    "summary": "Provide a comprehensive summary of this document. Extract the main points and key information.",
+    "insights": "Analyze this document and provide detailed insights. What are the key themes, important data points, and actionable information?",
+    "entities": "Extract all named entities from this document including people, organizations, locations, dates, and other important entities. Format as JSON.",
+    "sentiment": "Analyze the sentiment and tone of this document. Provide a sentiment score between -1 (negative) and 1 (positive).",
+    "full": (
+        "Analyze this document in a single pass. Respond with only a JSON object, without code fences or any other text, "
+        "matching this schema: {\"summary\": string (comprehensive summary of the main points, at most 500 characters), "
+        "\"key_insights\": [string] (up to 5 key themes, important data points or actionable items), "
+        "\"entities\": [{\"name\": string, \"type\": string}] (people, organizations, locations, dates and other important entities), "
+        "\"sentiment_score\": number (overall sentiment from -1 negative to 1 positive)}"
+    )
+}
+
+async def iter_upload(file: UploadFile):
+    """Yield an UploadFile's content in CHUNK_SIZE pieces without reading it whole."""
+    while True:
+        chunk = await file.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+async def store_upload(file: UploadFile):
+    """Stream a multipart upload into the blob store; returns (file_hash, size)."""
+    try:
+        with metrics.stage("blob_write"):
+            file_hash, size = await blob_store.put_stream(iter_upload(file))
+    except SpoolQuotaExceeded as e:
+        raise HTTPException(status_code=507, detail=f"Upload rejected: {str(e)}")
+    metrics.observe_payload("upload", size)
+    with metrics.stage("blob_record"):
+        await record_blob(file_hash, size, file.content_type)
+    return file_hash, size
+
+async def prepare_media(file_hash: Optional[str], content_type: Optional[str]) -> tuple:
+    """(hash, MIME type) of the chat attachment the model should see: a normalized variant for images, audio and video."""
+    if not file_hash:
+        return file_hash, content_type
+    with metrics.stage("media_normalize"):
+        return await media_normalizer.prepare(file_hash, content_type)
+
+def build_analysis_message(content_type: str, analysis_type: str, file_hash: str) -> UserMessage:
+    """Return the user message for analyzing a stored file."""
+    # The stored blob doubles as the file handed to the model
+    file_content_obj = FileContentWithMimeType(
+        file_path=str(blob_store.path_for(file_hash)),
+        mime_type=content_type
+    )
+    
+    prompt = ANALYSIS_PROMPTS.get(analysis_type, ANALYSIS_PROMPTS["summary"])
+    
+    user_message = UserMessage(
+        text=prompt,
+        file_contents=[file_content_obj]
+    )
+    return user_message
+
+async def extract_chunks(content_type: str, file_hash: str) -> Optional[List[str]]:
+    """Return text chunks for large files we can read locally, or None to send the whole file."""
+    if blob_store.size(file_hash) < CHUNKED_ANALYSIS_THRESHOLD_BYTES:
+        return None
+    try:
+        text = await asyncio.to_thread(extract_text, str(blob_store.path_for(file_hash)), content_type)
+    except Exception as e:
+        logger.error(f"Text extraction error: {str(e)}")
+        return None
+    if text is None:
+        return None
+    return await cpu_offloader.run(len(text), chunk_text, text, ANALYSIS_CHUNK_CHARS)
+
+async def map_chunks(chunks: List[str], analysis_type: str) -> List[str]:
+    """Analyze every chunk concurrently (bounded) and return the partial answers in order."""
+    prompt = ANALYSIS_PROMPTS.get(analysis_type, ANALYSIS_PROMPTS["summary"])
+    semaphore = asyncio.Semaphore(CHUNK_ANALYSIS_CONCURRENCY)
+    
+    async def analyze_chunk(index: int, chunk: str) -> str:
+        async with semaphore:
+            return await send_llm_message(analysis_chat(), UserMessage(
+                text=f"The text below is part {index + 1} of {len(chunks)} of a larger document. {prompt}\n\n---\n{chunk}"
+            ))
+    
+    return await asyncio.gather(*(analyze_chunk(index, chunk) for index, chunk in enumerate(chunks)))
+
+def build_reduce_message(partials: List[str], analysis_type: str) -> UserMessage:
+    prompt = ANALYSIS_PROMPTS.get(analysis_type, ANALYSIS_PROMPTS["summary"])
+    sections = "\n\n".join(f"Part {index + 1}:\n{partial}" for index, partial in enumerate(partials))
+    return UserMessage(
+        text=f"These are analyses of consecutive parts of one document. Combine them into a single answer for the whole document. {prompt}\n\n{sections}"
+    )
+
+async def build_document_message(
+    content_type: str,
+    analysis_type: str,
+    file_hash: str,
+    chunks: Optional[List[str]]
+) -> UserMessage:
+    """The message for the final analysis call over a stored file.
+    
+    Large documents with extractable text (chunks from extract_chunks) are analyzed
+    chunk by chunk and the partial results reduced.
+    """
+    if chunks:
+        partials = await map_chunks(chunks, analysis_type)
+        return build_reduce_message(partials, analysis_type)
+    # Documents go to the model as uploaded; only chat attachments are normalized,
+    # because the analysis cache key does not describe a media profile
+    return build_analysis_message(content_type, analysis_type, file_hash)
+
+async def analyze_with_llm(content_type: str, analysis_type: str, file_hash: str) -> dict:
+    """Run the model over a stored file and return the parsed analysis fields."""
+    chunks = await extract_chunks(content_type, file_hash)
+    user_message = await build_document_message(content_type, analysis_type, file_hash, chunks)
+    
+    # Send message to Gemini
+    response = await send_llm_message(analysis_chat(), user_message)
+    
+    return parse_analysis_response(response, analysis_type)
+
+async def cached_analysis_fields(cache_key: str, bypass_cache: bool) -> Optional[dict]:
+    with metrics.stage("cache_lookup"):
+        return None if bypass_cache else await analysis_cache.get(cache_key)
+
+def analysis_cache_key(file_hash: str, analysis_type: str) -> str:
+    return AnalysisCache.make_key(file_hash, analysis_type, LLM_MODEL, PROMPT_VERSION)
+
+async def get_analysis_fields(
+    content_type: str,
+    analysis_type: str,
+    session_id: str,
+    file_hash: str,
+    bypass_cache: bool = False
+) -> dict:
+    """Return analysis fields from the cache, calling the model on a miss."""
+    cache_key = analysis_cache_key(file_hash, analysis_type)
+    analysis_fields = await cached_analysis_fields(cache_key, bypass_cache)
+    if analysis_fields is None:
+        analysis_fields = await analyze_with_llm(content_type, analysis_type, file_hash)
+        await analysis_cache.set(cache_key, analysis_fields)
+    return analysis_fields
+
+async def save_document_analysis(
+    filename: str,
+    content_type: str,
+    file_size: int,
+    analysis_type: str,
+    session_id: str,
+    file_hash: str,
+    analysis_fields: dict
+) -> DocumentAnalysis:
+    # Create analysis result
+    analysis_result = DocumentAnalysis(
+        filename=filename,
+        content_type=content_type,
+        file_size=file_size,
+        analysis_type=analysis_type,
+        file_hash=file_hash,
+        session_id=session_id,
+        **analysis_fields
+    )
+    
+    # Store in database
+    with metrics.stage("db_insert"):
+        await db.document_analyses.insert_one(analysis_result.dict())
+    await resource_versions.bump(*analyses_resources([session_id]))
+    
+    return analysis_result
+
+async def run_document_analysis(
+    filename: str,
+    content_type: str,
+    file_size: int,
+    analysis_type: str,
+    session_id: str,
+    file_hash: str,
+    bypass_cache: bool = False
+) -> DocumentAnalysis:
+    analysis_fields = await get_analysis_fields(content_type, analysis_type, session_id, file_hash, bypass_cache)
+    
+    return await save_document_analysis(
+        filename, content_type, file_size, analysis_type, session_id, file_hash, analysis_fields
+    )
+
+async def update_job(job_id: str, **fields) -> None:
+    fields["updated_at"] = datetime.utcnow()
+    await db.analysis_jobs.update_one({"id": job_id}, {"$set": fields})
+    job_queue.notify(job_id)
+
+async def run_analysis_job(job: AnalysisJob) -> None:
+    await update_job(job.id, status="running")
+    try:
+        analysis_result = await run_document_analysis(
+            filename=job.filename,
+            content_type=job.content_type,
+            file_size=job.file_size,
+            analysis_type=job.analysis_type,
+            session_id=job.session_id,
+            file_hash=job.file_hash,
+            bypass_cache=job.bypass_cache
+        )
+    except asyncio.CancelledError:
+        await asyncio.shield(update_job(job.id, status="failed", error="Interrupted by server shutdown"))
+        raise
+    except Exception as e:
+        await update_job(job.id, status="failed", error=f"Analysis failed: {str(e)}")
+        raise
+    await update_job(job.id, status="completed", result=analysis_result.dict())
+
+async def fail_unfinished_jobs(query: dict, error: str) -> None:
+    """Mark queued/running jobs matching query as failed so their progress feeds end."""
+    jobs = await db.analysis_jobs.find(
+        {**query, "status": {"$in": ACTIVE_JOB_STATUSES}}, {"_id": 0, "id": 1}
+    ).to_list(None)
+    if not jobs:
+        return
+    job_ids = [job["id"] for job in jobs]
+    await db.analysis_jobs.update_many(
+        {"id": {"$in": job_ids}, "status": {"$in": ACTIVE_JOB_STATUSES}},
+        {"$set": {"status": "failed", "error": error, "updated_at": datetime.utcnow()}}
+    )
+    for job_id in job_ids:
+        job_queue.notify(job_id)
+    logger.warning(f"Marked {len(job_ids)} interrupted analysis jobs as failed")
+
+async def watch_analysis_jobs() -> None:
+    """Heartbeat this process's jobs and fail unfinished jobs whose process stopped heartbeating."""
+    while True:
+        now = datetime.utcnow()
+        try:
+            await db.analysis_jobs.update_many(
+                {"owner": INSTANCE_ID, "status": {"$in": ACTIVE_JOB_STATUSES}},
+                {"$set": {"heartbeat_at": now}}
+            )
+            cutoff = now - timedelta(seconds=JOB_STALE_SECONDS)
+            await fail_unfinished_jobs(
+                {"heartbeat_at": {"$lt": cutoff}},
+                "Interrupted: the server running this job stopped"
+            )
+        except Exception as e:
+            logger.error(f"Job heartbeat error: {str(e)}")
+        await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+
+async def enqueue_analysis_job(job: AnalysisJob) -> JSONResponse:
+    """Record the job and hand it to the worker pool; 429 when the queue is full."""
+    await db.analysis_jobs.insert_one({**job.dict(), "owner": INSTANCE_ID, "heartbeat_at": datetime.utcnow()})
+    try:
+        job_queue.submit(job.id, lambda: run_analysis_job(job))
+    except JobQueueFull as e:
+        await db.analysis_jobs.delete_one({"id": job.id})
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+    return JSONResponse(
+        status_code=202,
+        content=json.loads(job.json()),
+        headers={"Location": f"/api/jobs/{job.id}"}
+    )
+
+async def job_event_stream(job_id: str):
+    """Emit the job document whenever it changes until it completes or fails."""
+    last_updated = None
+    while True:
+        job = await db.analysis_jobs.find_one({"id": job_id})
+        if job is None:
+            yield sse_event("error", {"detail": "Job not found"})
+            return
+        if job["updated_at"] != last_updated:
+            last_updated = job["updated_at"]
+            yield sse_event(job["status"], AnalysisJob(**job).dict())
+        if job["status"] in ("completed", "failed"):
+            return
+        # Woken early by workers in this process; the timeout covers jobs run elsewhere
+        await job_queue.wait_for_change(job_id, timeout=JOB_POLL_INTERVAL_SECONDS)
+
+async def store_message_attachment(message_data: ChatMessageCreate) -> Optional[str]:
+    """Decode and store a base64 chat attachment; returns its hash, or None to continue text-only."""
+    if not (message_data.file_content and message_data.file_type):
+        return None
     try:
         # Decode base64 content
-        file_content = base64.b64decode(document_data.file_content)
-        
-        # Create temporary file for analysis
-        temp_file_path = f"/tmp/{document_data.filename}"
-        with open(temp_file_path, "wb") as f:
-            f.write(file_content)
+        with metrics.stage("decode"):
+            file_content = await cpu_offloader.run(
+                len(message_data.file_content), base64.b64decode, message_data.file_content
+            )
+        metrics.observe_payload("chat_attachment", len(file_content))
         
-        # Initialize Gemini chat
-        chat = LlmChat(
-            api_key=GEMINI_API_KEY,
-            session_id=document_data.session_id,
-            system_message="You are SaDA AI, an expert document analyzer. Analyze documents thoroughly and provide detailed insights, summaries, and extract key information. Always provide structured responses with clear summaries, key insights, and identify any entities or important data points."
-        ).with_model("gemini", "gemini-2.0-flash")
+        # Store the attachment once in the blob store
+        return await store_blob(file_content, message_data.file_type)
         
-        # Create file content for analysis
+    except Exception as e:
+        logger.error(f"File processing error: {str(e)}")
+        # Continue with text-only message
+        return None
+
+def build_support_message(
+    user_message: str,
+    file_hash: Optional[str] = None,
+    file_type: Optional[str] = None
+) -> UserMessage:
+    """Return the user message for a support chat turn."""
+    # Create user message, attaching the stored file if provided
+    user_message_content = UserMessage(text=user_message)
+    if file_hash and file_type:
         file_content_obj = FileContentWithMimeType(
-            file_path=temp_file_path,
-            mime_type=document_data.content_type
+            file_path=str(blob_store.path_for(file_hash)),
+            mime_type=file_type
         )
-        
-        # Analysis prompts based on type
-        analysis_prompts = {
-            "summary": "Provide a comprehensive summary of this document. Extract the main points and key information.",
-            "insights": "Analyze this document and provide detailed insights. What are the key themes, important data points, and actionable information?",
-            "entities": "Extract all named entities from this document including people, organizations, locations, dates, and other important entities. Format as JSON.",
-            "sentiment": "Analyze the sentiment and tone of this document. Provide a sentiment score between -1 (negative) and 1 (positive)."
-        }
-        
-        prompt = analysis_prompts.get(document_data.analysis_type, analysis_prompts["summary"])
-        
-        # Send message to Gemini
-        user_message = UserMessage(
-            text=prompt,
+        user_message_content = UserMessage(
+            text=user_message,
             file_contents=[file_content_obj]
         )
+    return user_message_content
+
+async def persist_chat_message(message: dict) -> None:
+    session_update = {"updated_at": datetime.utcnow()}
+    if CHAT_WRITE_MODE == "write_behind":
+        with metrics.stage("write_behind_enqueue"):
+            await chat_writer.insert("chat_messages", message)
+            await chat_writer.update("chat_sessions", {"id": message["session_id"]}, session_update)
+        return
+    
+    async def insert_message():
+        with metrics.stage("db_insert"):
+            await db.chat_messages.insert_one(message)
+    
+    async def update_session():
+        with metrics.stage("session_update"):
+            await db.chat_sessions.update_one({"id": message["session_id"]}, {"$set": session_update})
+    
+    # Independent writes: issue both and wait for both acknowledgements
+    await asyncio.gather(insert_message(), update_session())
+    await resource_versions.bump(*chat_resources([message["session_id"]]))
+
+async def save_chat_message(
+    session_id: str,
+    user_message: str,
+    ai_response: str,
+    message_type: str,
+    file_hash: Optional[str] = None,
+    file_type: Optional[str] = None
+) -> ChatMessage:
+    # Create chat message record
+    chat_message = ChatMessage(
+        session_id=session_id,
+        user_message=user_message,
+        ai_response=ai_response,
+        message_type=message_type,
+        file_hash=file_hash,
+        file_type=file_type if file_hash else None
+    )
+    
+    # Store the message and bump the session timestamp
+    await persist_chat_message(chat_message.dict())
+    
+    # Fold older turns into the running summary off the request path
+    if conversation_context.enabled:
+        run_in_background(roll_up_conversation(session_id))
+    
+    return chat_message
+
+async def run_chat_message(
+    session_id: str,
+    user_message: str,
+    message_type: str,
+    file_hash: Optional[str] = None,
+    file_type: Optional[str] = None
+) -> ChatMessage:
+    with metrics.stage("prompt_build"):
+        prompt = await build_support_prompt(session_id, user_message)
+    model_hash, model_type = await prepare_media(file_hash, file_type)
+    user_message_content = build_support_message(prompt, model_hash, model_type)
+    
+    # Send message to Gemini
+    response = await send_llm_message(support_chat(session_id), user_message_content)
+    
+    return await save_chat_message(session_id, user_message, response, message_type, file_hash, file_type)
+
+# Streaming helpers
+background_tasks = set()
+
+def run_in_background(coro) -> None:
+    """Schedule a coroutine that must outlive the current request (e.g. after a client disconnect)."""
+    task = asyncio.create_task(metrics.as_background(coro))
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+async def finish_abandoned_reply(reply: asyncio.Future, on_reply: Callable[[str], Awaitable]) -> None:
+    """Wait for a reply whose client went away and hand it to on_reply."""
+    try:
+        text = await reply
+    except Exception as e:
+        logger.error(f"Abandoned LLM reply failed: {str(e)}")
+        return
+    await on_reply(text)
+
+async def stream_llm_reply(chat, user_message, on_abandoned: Optional[Callable[[str], Awaitable]] = None):
+    """Yield response text as the model generates it.
+    
+    Falls back to a single chunk when the installed LlmChat has no streaming method. That
+    call is shielded from client disconnects: the answer is still produced and passed to
+    on_abandoned in the background, since nothing has reached the caller yet.
+    """
+    stream_message = getattr(chat, "stream_message", None)
+    if stream_message is None:
+        reply = asyncio.ensure_future(send_llm_message(chat, user_message))
+        try:
+            text = await asyncio.shield(reply)
+        except asyncio.CancelledError:
+            if on_abandoned is not None:
+                run_in_background(finish_abandoned_reply(reply, on_abandoned))
+            else:
+                reply.cancel()
+            raise
+        yield text
+        return
+    # Tokens already sent to the client cannot be replayed, so streams are governed but never retried
+    prompt_tokens = estimate_message_tokens(user_message)
+    streamed_chars = 0
+    try:
+        async with llm_governor.guard(prompt_tokens):
+            try:
+                with metrics.stage("llm"):
+                    async for chunk in stream_message(user_message):
+                        if chunk:
+                            streamed_chars += len(chunk)
+                            yield chunk
+            finally:
+                metrics.count_llm_tokens(prompt_tokens, streamed_chars // 4)
+    except CircuitOpenError as e:
+        raise llm_unavailable(e)
+
+async def chat_event_stream(
+    session_id: str,
+    user_message: str,
+    message_type: str,
+    file_hash: Optional[str] = None,
+    file_type: Optional[str] = None
+):
+    parts = []
+    completed = False
+    try:
+        prompt = await build_support_prompt(session_id, user_message)
+        model_hash, model_type = await prepare_media(file_hash, file_type)
+        user_message_content = build_support_message(prompt, model_hash, model_type)
+        on_abandoned = lambda reply: save_chat_message(
+            session_id, user_message, reply, message_type, file_hash, file_type
+        )
+        async for token in stream_llm_reply(support_chat(session_id), user_message_content, on_abandoned):
+            parts.append(token)
+            yield sse_event("token", {"text": token})
         
-        response = await chat.send_message(user_message)
-        
-        # Parse response for structured data
-        summary = response[:500] if len(response) > 500 else response
-        key_insights = [insight.strip() for insight in response.split('\n') if insight.strip() and len(insight.strip()) > 10][:5]
+        completed = True
+        chat_message = await save_chat_message(
+            session_id, user_message, "".join(parts), message_type, file_hash, file_type
+        )
+        yield sse_event("done", chat_message.dict())
+    except (asyncio.CancelledError, GeneratorExit):
+        # Client went away mid-stream: keep whatever was generated so far
+        if parts and not completed:
+            run_in_background(save_chat_message(
+                session_id, user_message, "".join(parts), message_type, file_hash, file_type
+            ))
+        raise
+    except Exception as e:
+        logger.error(f"Chat stream error: {str(e)}")
+        yield sse_event("error", {"detail": f"Chat failed: {str(e)}"})
+
+async def analysis_event_stream(
+    filename: str,
+    content_type: str,
+    file_size: int,
+    analysis_type: str,
+    session_id: str,
+    file_hash: str,
+    bypass_cache: bool = False
+):
+    try:
+        cache_key = analysis_cache_key(file_hash, analysis_type)
+        analysis_fields = await cached_analysis_fields(cache_key, bypass_cache)
+        if analysis_fields is None:
+            # Same steps as analyze_with_llm; only the final call streams
+            chunks = await extract_chunks(content_type, file_hash)
+            if chunks:
+                yield sse_event("progress", {"stage": "map", "chunks": len(chunks)})
+            user_message = await build_document_message(content_type, analysis_type, file_hash, chunks)
+            parts = []
+            on_abandoned = lambda reply: analysis_cache.set(cache_key, parse_analysis_response(reply, analysis_type))
+            async for token in stream_llm_reply(analysis_chat(), user_message, on_abandoned):
+                parts.append(token)
+                yield sse_event("token", {"text": token})
+            analysis_fields = parse_analysis_response("".join(parts), analysis_type)
+            await analysis_cache.set(cache_key, analysis_fields)
         
-        # Extract sentiment score (simplified)
-        sentiment_score = None
-        if "sentiment" in document_data.analysis_type.lower():
+        analysis_result = await save_document_analysis(
+            filename, content_type, file_size, analysis_type, session_id, file_hash, analysis_fields
+        )
+        yield sse_event("done", analysis_result.dict())
+    except Exception as e:
+        logger.error(f"Document analysis stream error: {str(e)}")
+        yield sse_event("error", {"detail": f"Analysis failed: {str(e)}"})
+
+async def batch_analysis_stream(uploads: list, analysis_types: List[str], session_id: str, bypass_cache: bool):
+    """Analyze every (file, analysis type) pair concurrently, yielding NDJSON lines as each finishes.
+    
+    Successful results are written with a single insert_many once all items are done.
+    """
+    semaphore = asyncio.Semaphore(ANALYSIS_BATCH_CONCURRENCY)
+    
+    async def analyze_item(index: int, upload: dict, analysis_type: str):
+        async with semaphore:
             try:
-                # Simple sentiment extraction from response
-                if "positive" in response.lower():
-                    sentiment_score = 0.7
-                elif "negative" in response.lower():
-                    sentiment_score = -0.7
-                else:
-                    sentiment_score = 0.0
-            except:
-                sentiment_score = 0.0
+                analysis_fields = await get_analysis_fields(
+                    upload["content_type"], analysis_type, session_id, upload["file_hash"], bypass_cache
+                )
+                analysis_result = DocumentAnalysis(
+                    filename=upload["filename"],
+                    content_type=upload["content_type"],
+                    file_size=upload["file_size"],
+                    analysis_type=analysis_type,
+                    file_hash=upload["file_hash"],
+                    session_id=session_id,
+                    **analysis_fields
+                )
+                return {"index": index, "status": "ok", "analysis": analysis_result.dict()}
+            except Exception as e:
+                logger.error(f"Batch analysis error for {upload['filename']}: {str(e)}")
+                return {
+                    "index": index,
+                    "status": "error",
+                    "filename": upload["filename"],
+                    "analysis_type": analysis_type,
+                    "detail": f"Analysis failed: {str(e)}"
+                }
+    
+    pairs = [(upload, analysis_type) for upload in uploads for analysis_type in analysis_types]
+    tasks = [
+        asyncio.create_task(analyze_item(index, upload, analysis_type))
+        for index, (upload, analysis_type) in enumerate(pairs)
+    ]
+    analyses = []
+    persisted = False
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            item = await next_done
+            if item["status"] == "ok":
+                analyses.append(item["analysis"])
+            yield json.dumps(item, default=str) + "\n"
+        
+        if analyses:
+            await insert_analyses(analyses)
+        persisted = True
+        yield json.dumps({
+            "status": "complete",
+            "total": len(pairs),
+            "succeeded": len(analyses),
+            "failed": len(pairs) - len(analyses)
+        }) + "\n"
+    finally:
+        for task in tasks:
+            task.cancel()
+        # Client went away mid-batch: keep the results that already finished
+        if analyses and not persisted:
+            run_in_background(insert_analyses(analyses))
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def model_response(model: BaseModel) -> JSONResponse:
+    return JSONResponse(content=jsonable_encoder(model))
+
+async def idempotent_response(
+    scope: str,
+    idempotency_key: Optional[str],
+    payload: dict,
+    handler: Callable[[], Awaitable[Response]]
+) -> Response:
+    """Run handler once per Idempotency-Key (or identical concurrent payload); duplicates get the same response."""
+    size = sum(len(value) for value in payload.values() if isinstance(value, str))
+    fingerprint = await cpu_offloader.run(size, payload_fingerprint, payload)
+    try:
+        response, shared = await idempotent_requests.run(scope, idempotency_key, fingerprint, handler)
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if shared:
+        response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+# Document Analysis Endpoints
+@api_router.post("/documents/analyze", response_model=DocumentAnalysis)
+async def analyze_document(
+    document_data: DocumentAnalysisCreate,
+    run_async: bool = Query(False, alias="async"),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    async def handle() -> Response:
+        try:
+            # Decode base64 content
+            with metrics.stage("decode"):
+                file_content = await cpu_offloader.run(
+                    len(document_data.file_content), base64.b64decode, document_data.file_content
+                )
+            metrics.observe_payload("document", len(file_content))
+            
+            # Store the file once in the blob store
+            file_hash = await store_blob(file_content, document_data.content_type)
+            
+            if run_async:
+                return await enqueue_analysis_job(AnalysisJob(
+                    filename=document_data.filename,
+                    content_type=document_data.content_type,
+                    file_size=document_data.file_size,
+                    analysis_type=document_data.analysis_type,
+                    session_id=document_data.session_id,
+                    file_hash=file_hash,
+                    bypass_cache=document_data.bypass_cache
+                ))
+            
+            return model_response(await run_document_analysis(
+                filename=document_data.filename,
+                content_type=document_data.content_type,
+                file_size=document_data.file_size,
+                analysis_type=document_data.analysis_type,
+                session_id=document_data.session_id,
+                file_hash=file_hash,
+                bypass_cache=document_data.bypass_cache
+            ))
+            
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Document analysis error: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+    
+    payload = {**document_data.dict(), "async": run_async}
+    return await idempotent_response("analyze_document", idempotency_key, payload, handle)
+
+@api_router.post("/documents/analyze/stream")
+async def analyze_document_stream(document_data: DocumentAnalysisCreate):
+    try:
+        # Decode base64 content
+        with metrics.stage("decode"):
+            file_content = await cpu_offloader.run(
+                len(document_data.file_content), base64.b64decode, document_data.file_content
+            )
+        metrics.observe_payload("document", len(file_content))
         
-        # Clean up temp file
-        os.remove(temp_file_path)
+        # Store the file once in the blob store
+        file_hash = await store_blob(file_content, document_data.content_type)
         
-        # Create analysis result
-        analysis_result = DocumentAnalysis(
+    except Exception as e:
+        logger.error(f"Document analysis error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+    
+    return StreamingResponse(
+        analysis_event_stream(
             filename=document_data.filename,
             content_type=document_data.content_type,
             file_size=document_data.file_size,
             analysis_type=document_data.analysis_type,
-            summary=summary,
-            key_insights=key_insights,
-            sentiment_score=sentiment_score,
-            entities=[],
-            file_content=document_data.file_content,
-            session_id=document_data.session_id
-        )
-        
-        # Store in database
-        await db.document_analyses.insert_one(analysis_result.dict())
-        
-        return analysis_result
-        
+            session_id=document_data.session_id,
+            file_hash=file_hash,
+            bypass_cache=document_data.bypass_cache
+        ),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+@api_router.post("/documents/analyze/upload", response_model=DocumentAnalysis)
+async def analyze_document_upload(
+    file: UploadFile = File(...),
+    session_id: str = Form(...),
+    analysis_type: str = Form("summary"),
+    bypass_cache: bool = Form(False),
+    run_async: bool = Query(False, alias="async"),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    try:
+        # Stream the upload straight into the blob store, no base64 round trip
+        file_hash, file_size = await store_upload(file)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Document analysis error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+    content_type = file.content_type or "application/octet-stream"
+    
+    async def handle() -> Response:
+        try:
+            if run_async:
+                return await enqueue_analysis_job(AnalysisJob(
+                    filename=file.filename,
+                    content_type=content_type,
+                    file_size=file_size,
+                    analysis_type=analysis_type,
+                    session_id=session_id,
+                    file_hash=file_hash,
+                    bypass_cache=bypass_cache
+                ))
+            
+            return model_response(await run_document_analysis(
+                filename=file.filename,
+                content_type=content_type,
+                file_size=file_size,
+                analysis_type=analysis_type,
+                session_id=session_id,
+                file_hash=file_hash,
+                bypass_cache=bypass_cache
+            ))
+            
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Document analysis error: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+    
+    # The stored file's hash stands in for its content
+    payload = {
+        "filename": file.filename,
+        "content_type": content_type,
+        "file_hash": file_hash,
+        "analysis_type": analysis_type,
+        "session_id": session_id,
+        "bypass_cache": bypass_cache,
+        "async": run_async
+    }
+    return await idempotent_response("analyze_document_upload", idempotency_key, payload, handle)
+
+@api_router.post("/documents/analyze/batch")
+async def analyze_documents_batch(
+    files: List[UploadFile] = File(...),
+    session_id: str = Form(...),
+    analysis_types: str = Form("summary"),
+    bypass_cache: bool = Form(False)
+):
+    requested_types = [analysis_type.strip() for analysis_type in analysis_types.split(",") if analysis_type.strip()]
+    if not requested_types:
+        raise HTTPException(status_code=400, detail="At least one analysis type is required")
+    
+    try:
+        # Spool every upload before streaming; the request body is gone once the response starts
+        uploads = []
+        for file in files:
+            file_hash, file_size = await store_upload(file)
+            uploads.append({
+                "filename": file.filename,
+                "content_type": file.content_type or "application/octet-stream",
+                "file_size": file_size,
+                "file_hash": file_hash
+            })
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Batch upload error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+    
+    return StreamingResponse(
+        batch_analysis_stream(uploads, requested_types, session_id, bypass_cache),
+        media_type="application/x-ndjson"
+    )
+
+# Search Endpoint
+@api_router.get("/search")
+async def search(
+    q: str = Query(..., min_length=1),
+    session_id: Optional[str] = None,
+    kind: Optional[str] = Query(None, regex="^(analysis|message)$"),
+    limit: int = Query(10, ge=1, le=100)
+):
+    if search_index is None:
+        raise HTTPException(status_code=503, detail="Search is not available in this worker process")
+    return await asyncio.to_thread(search_index.search, q, session_id=session_id, kind=kind, limit=limit)
+
+@api_router.get("/search/stats")
+async def get_search_stats():
+    if search_writer is None:
+        return {"enabled": False}
+    return {"enabled": True, **search_writer.stats()}
+
+@api_router.get("/spool/stats")
+async def get_spool_stats():
+    return spool_manager.stats()
+
+@api_router.get("/runtime/stats")
+async def get_runtime_stats():
+    return {"cpu_executor": cpu_offloader.stats(), "event_loop": loop_lag_monitor.stats()}
+
+@api_router.get("/idempotency/stats")
+async def get_idempotency_stats():
+    return idempotent_requests.stats()
+
+@api_router.get("/chat/archive/stats")
+async def get_chat_archive_stats():
+    return chat_archive.stats()
+
+@api_router.post("/chat/archive/compact")
+async def compact_chat_archive():
+    """Run one compaction pass now instead of waiting for the background job."""
+    if not chat_archive.idle_days:
+        raise HTTPException(status_code=409, detail="Chat archiving is disabled (CHAT_ARCHIVE_AFTER_DAYS=0)")
+    return {"archived": await chat_archive.compact()}
+
+@api_router.get("/media/stats")
+async def get_media_stats():
+    return media_normalizer.stats()
+
+@api_router.get("/chat/writes/stats")
+async def get_chat_write_stats():
+    return {"mode": CHAT_WRITE_MODE, **chat_writer.stats()}
+
+@api_router.get("/llm/governor/stats")
+async def get_llm_governor_stats():
+    return llm_governor.stats()
+
+# Analysis Job Endpoints
+@api_router.get("/jobs/stats")
+async def get_job_stats():
+    return job_queue.stats()
+
+@api_router.get("/jobs/{job_id}", response_model=AnalysisJob)
+async def get_job(job_id: str):
+    job = await db.analysis_jobs.find_one({"id": job_id})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return AnalysisJob(**job)
+
+@api_router.get("/jobs/{job_id}/events")
+async def get_job_events(job_id: str):
+    if not await db.analysis_jobs.find_one({"id": job_id}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return StreamingResponse(job_event_stream(job_id), media_type="text/event-stream", headers=SSE_HEADERS)
 
 @api_router.get("/documents/analyses", response_model=List[DocumentAnalysis])
-async def get_document_analyses():
-    analyses = await db.document_analyses.find().sort("timestamp", -1).to_list(100)
-    return [DocumentAnalysis(**analysis) for analysis in analyses]
+async def get_document_analyses(
+    request: Request,
+    response: Response,
+    after: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    include: Optional[str] = None,
+    accept_encoding: Optional[str] = Header(None)
+):
+    async def build() -> Response:
+        analyses = await fetch_page(
+            db.document_analyses, {}, "timestamp", -1, after, limit, response,
+            list_projection(DocumentAnalysis, include)
+        )
+        return await list_response(analyses, DocumentAnalysis, response, accept_encoding)
+    
+    return await conditional_list_response(request, "document_analyses", accept_encoding, build)
 
 @api_router.get("/documents/analyses/{session_id}", response_model=List[DocumentAnalysis])
-async def get_session_analyses(session_id: str):
-    analyses = await db.document_analyses.find({"session_id": session_id}).sort("timestamp", -1).to_list(100)
-    return [DocumentAnalysis(**analysis) for analysis in analyses]
+async def get_session_analyses(
+    session_id: str,
+    request: Request,
+    response: Response,
+    after: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    include: Optional[str] = None,
+    accept_encoding: Optional[str] = Header(None)
+):
+    async def build() -> Response:
+        analyses = await fetch_page(
+            db.document_analyses, {"session_id": session_id}, "timestamp", -1, after, limit, response,
+            list_projection(DocumentAnalysis, include)
+        )
+        return await list_response(analyses, DocumentAnalysis, response, accept_encoding)
+    
+    return await conditional_list_response(request, f"document_analyses:{session_id}", accept_encoding, build)
+
+@api_router.get("/responses/cache/stats")
+async def get_response_cache_stats():
+    return response_cache.stats()
+
+@api_router.get("/documents/cache/stats")
+async def get_analysis_cache_stats():
+    return analysis_cache.stats()
 
 # Multimodal Chat Endpoints
 @api_router.post("/chat/message", response_model=ChatMessage)
-async def send_chat_message(message_data: ChatMessageCreate):
-    try:
-        # Initialize Gemini chat
-        chat = LlmChat(
-            api_key=GEMINI_API_KEY,
-            session_id=message_data.session_id,
-            system_message="You are SaDA AI, an advanced customer support assistant. You can analyze text, images, audio, and video content. Provide helpful, detailed responses and assist with customer inquiries. For product defects or technical issues, analyze any provided media and offer solutions."
-        ).with_model("gemini", "gemini-2.0-flash")
-        
-        # Create user message
-        user_message_content = UserMessage(text=message_data.user_message)
-        
-        # Handle file content if provided
-        if message_data.file_content and message_data.file_type:
-            try:
-                # Decode base64 content
-                file_content = base64.b64decode(message_data.file_content)
-                
-                # Create temporary file
-                temp_file_path = f"/tmp/chat_file_{uuid.uuid4()}.{message_data.file_type.split('/')[-1]}"
-                with open(temp_file_path, "wb") as f:
-                    f.write(file_content)
-                
-                # Create file content object
-                file_content_obj = FileContentWithMimeType(
-                    file_path=temp_file_path,
-                    mime_type=message_data.file_type
-                )
-                
-                # Add file to message
-                user_message_content = UserMessage(
-                    text=message_data.user_message,
-                    file_contents=[file_content_obj]
-                )
-                
-            except Exception as e:
-                logger.error(f"File processing error: {str(e)}")
-                # Continue with text-only message
-                pass
-        
-        # Send message to Gemini
-        response = await chat.send_message(user_message_content)
-        
-        # Clean up temp file if created
+async def send_chat_message(
+    message_data: ChatMessageCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    async def handle() -> Response:
         try:
-            if 'temp_file_path' in locals():
-                os.remove(temp_file_path)
-        except:
-            pass
-        
-        # Create chat message record
-        chat_message = ChatMessage(
+            # Handle file content if provided
+            file_hash = await store_message_attachment(message_data)
+            
+            return model_response(await run_chat_message(
+                session_id=message_data.session_id,
+                user_message=message_data.user_message,
+                message_type=message_data.message_type,
+                file_hash=file_hash,
+                file_type=message_data.file_type
+            ))
+            
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Chat message error: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Chat failed: {str(e)}")
+    
+    return await idempotent_response("chat_message", idempotency_key, message_data.dict(), handle)
+
+@api_router.post("/chat/message/stream")
+async def send_chat_message_stream(message_data: ChatMessageCreate):
+    file_hash = await store_message_attachment(message_data)
+    return StreamingResponse(
+        chat_event_stream(
             session_id=message_data.session_id,
             user_message=message_data.user_message,
-            ai_response=response,
             message_type=message_data.message_type,
-            file_content=message_data.file_content,
+            file_hash=file_hash,
             file_type=message_data.file_type
-        )
-        
-        # Store in database
-        await db.chat_messages.insert_one(chat_message.dict())
-        
-        # Update session timestamp
-        await db.chat_sessions.update_one(
-            {"id": message_data.session_id},
-            {"$set": {"updated_at": datetime.utcnow()}}
-        )
-        
-        return chat_message
-        
+        ),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+@api_router.post("/chat/message/upload", response_model=ChatMessage)
+async def send_chat_message_upload(
+    session_id: str = Form(...),
+    user_message: str = Form(...),
+    message_type: str = Form("text"),
+    file: Optional[UploadFile] = File(None),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    try:
+        # Stream the attachment straight into the blob store, no base64 round trip
+        file_hash = None
+        file_type = None
+        if file is not None and file.filename:
+            file_hash, _ = await store_upload(file)
+            file_type = file.content_type or "application/octet-stream"
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Chat message error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Chat failed: {str(e)}")
+    
+    async def handle() -> Response:
+        try:
+            return model_response(await run_chat_message(
+                session_id=session_id,
+                user_message=user_message,
+                message_type=message_type,
+                file_hash=file_hash,
+                file_type=file_type
+            ))
+            
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Chat message error: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Chat failed: {str(e)}")
+    
+    payload = {
+        "session_id": session_id,
+        "user_message": user_message,
+        "message_type": message_type,
+        "file_hash": file_hash,
+        "file_type": file_type
+    }
+    return await idempotent_response("chat_message_upload", idempotency_key, payload, handle)
 
 @api_router.get("/chat/messages/{session_id}", response_model=List[ChatMessage])
-async def get_chat_messages(session_id: str):
-    messages = await db.chat_messages.find({"session_id": session_id}).sort("timestamp", 1).to_list(1000)
-    return [ChatMessage(**message) for message in messages]
+async def get_chat_messages(
+    session_id: str,
+    request: Request,
+    response: Response,
+    after: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=MAX_PAGE_SIZE),
+    include: Optional[str] = None,
+    accept_encoding: Optional[str] = Header(None)
+):
+    # Archived sessions are restored before their history is read
+    await chat_archive.rehydrate(session_id)
+    
+    async def build() -> Response:
+        messages = await fetch_page(
+            db.chat_messages, {"session_id": session_id}, "timestamp", 1, after, limit, response,
+            list_projection(ChatMessage, include)
+        )
+        return await list_response(messages, ChatMessage, response, accept_encoding)
+    
+    return await conditional_list_response(request, f"chat_messages:{session_id}", accept_encoding, build)
+
+async def iter_blob_base64(file_hash: str):
+    """Yield a blob base64 encoded, CHUNK_SIZE at a time; chunks are cut at multiples of 3 so they concatenate."""
+    remainder = b""
+    async for chunk in blob_store.iter_range(file_hash):
+        data = remainder + chunk
+        cut = len(data) - len(data) % 3
+        remainder = data[cut:]
+        yield base64.b64encode(data[:cut])
+    yield base64.b64encode(remainder)
+
+async def iter_export_record(record_type: str, document: dict, include_attachments: bool):
+    """Yield one NDJSON line, streaming the referenced attachment into file_content when requested."""
+    file_hash = document.get("file_hash")
+    stream_attachment = (
+        include_attachments and file_hash and not document.get("file_content") and blob_store.exists(file_hash)
+    )
+    if stream_attachment:
+        document.pop("file_content", None)
+    line = orjson.dumps({"type": record_type, **document}, default=str)
+    if not stream_attachment:
+        yield line + b"\n"
+        return
+    # Reopen the object to append the attachment without holding it (or its base64) in memory
+    yield line[:-1] + b',"file_content":"'
+    async for piece in iter_blob_base64(file_hash):
+        yield piece
+    yield b'"}\n'
+
+async def session_export_stream(session: dict, include_attachments: bool, batch_size: int, compress: bool):
+    """Yield a session, its messages and its analyses as NDJSON, one cursor batch in memory at a time."""
+    session_id = session["id"]
+    include = "file_content" if include_attachments else None
+    sources = [
+        ("message", db.chat_messages, list_projection(ChatMessage, include)),
+        ("analysis", db.document_analyses, list_projection(DocumentAnalysis, include)),
+    ]
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    async def records():
+        yield orjson.dumps({"type": "session", **session}, default=str) + b"\n"
+        for record_type, collection, projection in sources:
+            cursor = collection.find({"session_id": session_id}, projection, batch_size=batch_size)
+            async for document in cursor.sort([("timestamp", 1), ("id", 1)]):
+                async for piece in iter_export_record(record_type, document, include_attachments):
+                    yield piece
+
+    async for piece in records():
+        if compressor is None:
+            yield piece
+            continue
+        compressed = compressor.compress(piece)
+        if compressed:
+            yield compressed
+    if compressor is not None:
+        yield compressor.flush()
+
+@api_router.get("/chat/sessions/{session_id}/export")
+async def export_chat_session(
+    session_id: str,
+    include_attachments: bool = False,
+    gzip: bool = False,
+    batch_size: int = Query(500, ge=1, le=MAX_PAGE_SIZE)
+):
+    session = await db.chat_sessions.find_one({"id": session_id}, list_projection(ChatSession))
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    # Archived history is restored first so the export is complete
+    await chat_archive.rehydrate(session_id)
+    
+    filename = f"session-{session_id}.ndjson" + (".gz" if gzip else "")
+    return StreamingResponse(
+        session_export_stream(session, include_attachments, batch_size, gzip),
+        media_type="application/gzip" if gzip else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', "Cache-Control": "no-store"}
+    )
 
 # File Upload Endpoint
 @api_router.post("/upload")
 async def upload_file(file: UploadFile = File(...)):
     try:
         # Read file content
-        content = await file.read()
+        with metrics.stage("read"):
+            content = await file.read()
+        metrics.observe_payload("upload", len(content))
         
         # Encode to base64
-        file_base64 = base64.b64encode(content).decode('utf-8')
+        with metrics.stage("encode"):
+            file_base64 = await cpu_offloader.run(len(content), b64encode_text, content)
         
         return {
             "filename": file.filename,
@@ -329,16 +1655,75 @@ async def upload_file(file: UploadFile = File(...)):
         logger.error(f"File upload error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
+# Blob Download Endpoint
+INLINE_IMAGE_TYPES = {"image/png", "image/jpeg", "image/gif", "image/webp", "image/avif", "image/bmp"}
+
+def is_inline_media_type(media_type: str) -> bool:
+    """True for types browsers render without running script (SVG is an image that can carry script)."""
+    media_type = media_type.split(";")[0].strip().lower()
+    return (
+        media_type in INLINE_IMAGE_TYPES
+        or media_type == "application/pdf"
+        or media_type.startswith(("audio/", "video/"))
+    )
+
+@api_router.get("/blobs/{file_hash}")
+async def download_blob(file_hash: str, range_header: Optional[str] = Header(None, alias="Range")):
+    if not blob_store.exists(file_hash):
+        raise HTTPException(status_code=404, detail="Blob not found")
+    
+    blob_info = await db.blobs.find_one({"hash": file_hash}) or {}
+    media_type = blob_info.get("content_type") or "application/octet-stream"
+    size = blob_store.size(file_hash)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": f'"{file_hash}"',
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "X-Content-Type-Options": "nosniff"
+    }
+    # The content type comes from the uploader: anything that could run as script on this origin is downloaded
+    if not is_inline_media_type(media_type):
+        headers["Content-Disposition"] = "attachment"
+    
+    if range_header:
+        byte_range = parse_range_header(range_header, size)
+        if byte_range is None:
+            raise HTTPException(
+                status_code=416,
+                detail="Requested range not satisfiable",
+                headers={"Content-Range": f"bytes */{size}"}
+            )
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(
+            blob_store.iter_range(file_hash, start, end),
+            status_code=206,
+            media_type=media_type,
+            headers=headers
+        )
+    
+    headers["Content-Length"] = str(size)
+    return StreamingResponse(blob_store.iter_range(file_hash), media_type=media_type, headers=headers)
+
 # Include the router in the main app
 app.include_router(api_router)
 
+# Prometheus scrape endpoint, served outside /api like other operational endpoints
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Idempotent-Replayed"],
 )
+app.add_middleware(metrics.MetricsMiddleware)
 
 # Configure logging
 logging.basicConfig(
@@ -347,6 +1732,101 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def ensure_db_indexes():
+    await ensure_indexes(db)
+    await analysis_cache.ensure_indexes()
+
+@app.on_event("startup")
+async def start_loop_lag_monitor():
+    loop_lag_monitor.start()
+
+@app.on_event("startup")
+async def start_chat_archive():
+    if chat_archive.idle_days:
+        chat_archive.start()
+    elif await chat_archive.find_leftover_archives():
+        logger.info("Chat archiving is disabled; sessions archived earlier are restored when they are read")
+
+@app.on_event("startup")
+async def start_job_workers():
+    job_queue.start()
+    # Also fails jobs left unfinished by a previous run
+    job_watcher_tasks.append(asyncio.create_task(watch_analysis_jobs()))
+
+@app.on_event("startup")
+async def start_chat_writer():
+    if CHAT_WRITE_MODE == "write_behind":
+        chat_writer.start()
+
+@app.on_event("startup")
+async def clean_spool_dir():
+    removed = await asyncio.to_thread(spool_manager.remove_stale)
+    if removed:
+        logger.info(f"Removed {removed} stale spool files")
+
+# Sources the search index follows: kind -> (collection, projection, record builder)
+SEARCH_SOURCES = {
+    "analysis": (
+        db.document_analyses,
+        {"_id": 0, "id": 1, "session_id": 1, "summary": 1, "key_insights": 1, "timestamp": 1},
+        analysis_search_record
+    ),
+    "message": (
+        db.chat_messages,
+        {"_id": 0, "id": 1, "session_id": 1, "ai_response": 1, "timestamp": 1},
+        message_search_record
+    ),
+}
+
+async def index_new_records() -> None:
+    """Index records stored since each source's cursor, by any worker process."""
+    for kind, (collection, projection, to_record) in SEARCH_SOURCES.items():
+        cursor = search_index.cursors.get(kind)
+        query = {}
+        if cursor:
+            # Re-read an overlap: write-behind flushes and other workers can store records late
+            query = {"timestamp": {"$gte": datetime.fromisoformat(cursor) - timedelta(seconds=SEARCH_INDEX_OVERLAP_SECONDS)}}
+        latest = None
+        async for document in collection.find(query, projection).sort("timestamp", 1):
+            await search_writer.add(*to_record(document))
+            latest = document["timestamp"]
+        if latest is not None and latest.isoformat() != cursor:
+            await search_writer.drain()
+            search_index.set_cursor(kind, latest.isoformat())
+
+async def follow_search_sources() -> None:
+    """Keep the search index current with what every worker stores."""
+    while True:
+        try:
+            await index_new_records()
+        except Exception as e:
+            logger.error(f"Search indexing error: {str(e)}")
+        await asyncio.sleep(SEARCH_INDEX_POLL_SECONDS)
+
+@app.on_event("startup")
+async def start_search_indexing():
+    # Only the process that owns the index directory follows the collections
+    if search_writer is None:
+        return
+    search_writer.start()
+    search_follow_tasks.append(asyncio.create_task(follow_search_sources()))
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    for task in job_watcher_tasks:
+        task.cancel()
+    abandoned = await job_queue.stop()
+    await fail_unfinished_jobs({"id": {"$in": abandoned}}, "Interrupted by server shutdown")
+    # Jobs may have queued chat writes; flush before the client closes
+    await chat_writer.stop()
+    await chat_archive.stop()
+    for task in search_follow_tasks:
+        task.cancel()
+    if search_writer is not None:
+        await search_writer.stop()
+        search_index.close()
+    media_normalizer.shutdown()
+    cpu_offloader.shutdown()
+    await loop_lag_monitor.stop()
     client.close()
\ No newline at end of file
@@ -0,0 +1,128 @@
+import asyncio
+import hashlib
+import time
+import uuid
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Awaitable, Callable, Optional, Union
+
+HASH_READ_SIZE = 1024 * 1024
+
+
+class SpoolQuotaExceeded(Exception):
+    pass
+
+
+def sha256_file(path: Union[str, Path]) -> str:
+    """SHA-256 hex digest of a file (module level so a process pool can run it)."""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_READ_SIZE), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+class SpoolFile:
+    """A uniquely named spool file; ``finish`` closes it and hashes its content."""
+
+    def __init__(self, manager: "SpoolManager", path: Path, handle):
+        self.manager = manager
+        self.path = path
+        self.size = 0
+        self.digest: Optional[str] = None
+        self._handle = handle
+
+    async def write(self, chunk: bytes) -> None:
+        self.manager.reserve(len(chunk))
+        self.size += len(chunk)
+        await asyncio.to_thread(self._handle.write, chunk)
+
+    async def close(self) -> None:
+        if not self._handle.closed:
+            await asyncio.to_thread(self._handle.close)
+
+    async def finish(self) -> str:
+        """Close the file and return the SHA-256 of everything written."""
+        await self.close()
+        self.digest = await self.manager.run_cpu(self.size, sha256_file, self.path)
+        return self.digest
+
+
+class SpoolManager:
+    """Hands out per-request spool files under a quota and always removes them afterwards.
+
+    Hashing goes through ``run_cpu`` (a CpuOffloader's ``run``) when given,
+    otherwise a thread.
+    """
+
+    def __init__(
+        self,
+        directory: Union[str, Path],
+        quota_bytes: int,
+        run_cpu: Optional[Callable[..., Awaitable]] = None
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.quota_bytes = quota_bytes
+        self._run_cpu = run_cpu
+        self.used_bytes = 0
+        self.active = 0
+        self.rejected = 0
+
+    async def run_cpu(self, size: int, func, *args):
+        if self._run_cpu is not None:
+            return await self._run_cpu(size, func, *args)
+        return await asyncio.to_thread(func, *args)
+
+    def reserve(self, size: int) -> None:
+        if self.used_bytes + size > self.quota_bytes:
+            self.rejected += 1
+            raise SpoolQuotaExceeded(f"Spool quota of {self.quota_bytes} bytes exceeded")
+        self.used_bytes += size
+
+    def _create(self):
+        path = self.directory / f"spool-{uuid.uuid4().hex}"
+        return path, open(path, "xb")
+
+    @staticmethod
+    def _remove(path: Path) -> None:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+    @asynccontextmanager
+    async def open(self):
+        """Yield a SpoolFile; on exit it is closed, its quota released and the file removed unless moved away."""
+        path, handle = await asyncio.to_thread(self._create)
+        spool_file = SpoolFile(self, path, handle)
+        self.active += 1
+        try:
+            yield spool_file
+        finally:
+            await spool_file.close()
+            await asyncio.to_thread(self._remove, path)
+            self.used_bytes -= spool_file.size
+            self.active -= 1
+
+    def remove_stale(self, max_age_seconds: float = 3600) -> int:
+        """Delete spool files left behind by crashed processes."""
+        cutoff = time.time() - max_age_seconds
+        removed = 0
+        for path in self.directory.glob("spool-*"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def stats(self) -> dict:
+        return {
+            "directory": str(self.directory),
+            "active": self.active,
+            "used_bytes": self.used_bytes,
+            "quota_bytes": self.quota_bytes,
+            "rejected": self.rejected
+        }
@@ -0,0 +1,126 @@
+import asyncio
+import json
+import logging
+import time
+from collections import defaultdict
+from typing import Awaitable, Callable, Optional
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindWriter:
+    """Queues inserts and $set updates and writes them in batches from a background task.
+
+    Updates to the same document are coalesced, so a burst of session
+    timestamp bumps becomes one write. The queue is bounded: when it is
+    full, callers wait (backpressure) instead of growing memory.
+    ``after_flush`` is awaited with each batch once it has been written.
+    """
+
+    def __init__(
+        self,
+        db,
+        max_queue_size: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 0.2,
+        after_flush: Optional[Callable[[list], Awaitable[None]]] = None
+    ):
+        self.db = db
+        self.after_flush = after_flush
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self._task: Optional[asyncio.Task] = None
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+
+    async def insert(self, collection: str, document: dict) -> None:
+        await self._queue.put(("insert", collection, document, None))
+
+    async def update(self, collection: str, query: dict, fields: dict) -> None:
+        await self._queue.put(("update", collection, query, fields))
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Write everything still queued, then stop the flusher."""
+        if self._task is None:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _collect(self) -> list:
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._collect()
+            try:
+                await self._write(batch)
+            except Exception as e:
+                self.failed += len(batch)
+                logger.error(f"Write-behind flush of {len(batch)} operations failed: {str(e)}")
+            else:
+                await self._after_flush(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _after_flush(self, batch: list) -> None:
+        if self.after_flush is None:
+            return
+        try:
+            await self.after_flush(batch)
+        except Exception as e:
+            logger.error(f"Write-behind after_flush hook failed: {str(e)}")
+
+    async def _write(self, batch: list) -> None:
+        inserts = defaultdict(list)
+        updates = defaultdict(dict)
+        for kind, collection, document, fields in batch:
+            if kind == "insert":
+                inserts[collection].append(document)
+            else:
+                key = json.dumps(document, sort_keys=True, default=str)
+                _, merged = updates[collection].get(key, (document, {}))
+                updates[collection][key] = (document, {**merged, **fields})
+
+        # Inserts first so updates never run ahead of the documents they describe
+        for collection, documents in inserts.items():
+            await self.db[collection].insert_many(documents, ordered=False)
+        for collection, pending in updates.items():
+            await self.db[collection].bulk_write(
+                [UpdateOne(query, {"$set": fields}) for query, fields in pending.values()],
+                ordered=False
+            )
+        self.written += len(batch)
+        self.batches += 1
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "failed": self.failed,
+            "batches": self.batches,
+            "running": self._task is not None
+        }
@@ -18,6 +18,22 @@ gsap.registerPlugin(ScrollTrigger, TextPlugin, useGSAP);
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
 
+const newIdempotencyKey = () =>
+  (window.crypto && window.crypto.randomUUID)
+    ? window.crypto.randomUUID()
+    : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+
+// One key per logical submit, kept in pendingRef until it succeeds: a double-click or a retry
+// after an error resends the same key, so the backend answers it with the first response
+const submitKeyFor = (pendingRef, signature) => {
+  if (!pendingRef.current || pendingRef.current.signature !== signature) {
+    pendingRef.current = { signature, key: newIdempotencyKey() };
+  }
+  return pendingRef.current.key;
+};
+
+const fileSignature = (file) => file ? [file.name, file.size, file.lastModified] : null;
+
 // 3D Scene Components with new color scheme
 const FloatingOrb = ({ position, color, scale = 1 }) => {
   const meshRef = useRef();
@@ -470,6 +486,7 @@ const DocumentAnalysis = () => {
   const [currentSession, setCurrentSession] = useState(null);
   const [analyses, setAnalyses] = useState([]);
   const [loading, setLoading] = useState(false);
+  const pendingSubmitRef = useRef(null);
   const [analysisType, setAnalysisType] = useState('summary');
   const containerRef = useRef(null);
   const sidebarRef = useRef(null);
@@ -564,30 +581,26 @@ const DocumentAnalysis = () => {
     });
     
     try {
-      const reader = new FileReader();
-      reader.onload = async (e) => {
-        const base64Content = e.target.result.split(',')[1];
-        
-        const analysisResponse = await axios.post(`${API}/documents/analyze`, {
-          filename: file.name,
-          content_type: file.type,
-          file_size: file.size,
-          analysis_type: analysisType,
-          file_content: base64Content,
-          session_id: currentSession.id
-        });
-        
-        setAnalyses(prev => [analysisResponse.data, ...prev]);
-        setLoading(false);
-        
-        // Animate new analysis result
-        gsap.fromTo(".analysis-result:first-child",
-          { y: 50, opacity: 0, scale: 0.9 },
-          { y: 0, opacity: 1, scale: 1, duration: 0.6, ease: "power3.out" }
-        );
-      };
+      // Multipart upload streams the file without a base64 copy
+      const formData = new FormData();
+      formData.append('file', file);
+      formData.append('analysis_type', analysisType);
+      formData.append('session_id', currentSession.id);
       
-      reader.readAsDataURL(file);
+      const signature = JSON.stringify([currentSession.id, analysisType, fileSignature(file)]);
+      const analysisResponse = await axios.post(`${API}/documents/analyze/upload`, formData, {
+        headers: { 'Idempotency-Key': submitKeyFor(pendingSubmitRef, signature) }
+      });
+      pendingSubmitRef.current = null;
+      
+      setAnalyses(prev => [analysisResponse.data, ...prev]);
+      setLoading(false);
+      
+      // Animate new analysis result
+      gsap.fromTo(".analysis-result:first-child",
+        { y: 50, opacity: 0, scale: 0.9 },
+        { y: 0, opacity: 1, scale: 1, duration: 0.6, ease: "power3.out" }
+      );
     } catch (error) {
       console.error('Error analyzing document:', error);
       setLoading(false);
@@ -684,7 +697,7 @@ const DocumentAnalysis = () => {
             >
               <h3 className="text-xl font-bold text-gray-800 mb-4">Analysis Type</h3>
               <div className="flex flex-wrap gap-3">
-                {['summary', 'insights', 'entities', 'sentiment'].map((type, index) => (
+                {['summary', 'insights', 'entities', 'sentiment', 'full'].map((type, index) => (
                   <motion.button
                     key={type}
                     onClick={() => setAnalysisType(type)}
@@ -879,6 +892,7 @@ const CustomerSupport = () => {
   const [messages, setMessages] = useState([]);
   const [inputMessage, setInputMessage] = useState('');
   const [loading, setLoading] = useState(false);
+  const pendingSubmitRef = useRef(null);
   const [attachedFile, setAttachedFile] = useState(null);
   const messagesEndRef = useRef(null);
   const chatRef = useRef(null);
@@ -989,35 +1003,29 @@ const CustomerSupport = () => {
     });
     
     try {
-      let fileContent = null;
-      let fileType = null;
-      
-      if (attachedFile) {
-        const reader = new FileReader();
-        reader.onload = async (e) => {
-          fileContent = e.target.result.split(',')[1];
-          fileType = attachedFile.type;
-          await sendMessageToAPI(fileContent, fileType);
-        };
-        reader.readAsDataURL(attachedFile);
-      } else {
-        await sendMessageToAPI(null, null);
-      }
+      await sendMessageToAPI(attachedFile);
     } catch (error) {
       console.error('Error sending message:', error);
       setLoading(false);
     }
   };
   
-  const sendMessageToAPI = async (fileContent, fileType) => {
+  const sendMessageToAPI = async (file) => {
     try {
-      const response = await axios.post(`${API}/chat/message`, {
-        session_id: currentSession.id,
-        user_message: inputMessage,
-        message_type: fileType ? fileType.split('/')[0] : 'text',
-        file_content: fileContent,
-        file_type: fileType
+      // Multipart upload streams the attachment without a base64 copy
+      const formData = new FormData();
+      formData.append('session_id', currentSession.id);
+      formData.append('user_message', inputMessage);
+      formData.append('message_type', file ? file.type.split('/')[0] : 'text');
+      if (file) {
+        formData.append('file', file);
+      }
+      
+      const signature = JSON.stringify([currentSession.id, inputMessage, fileSignature(file)]);
+      const response = await axios.post(`${API}/chat/message/upload`, formData, {
+        headers: { 'Idempotency-Key': submitKeyFor(pendingSubmitRef, signature) }
       });
+      pendingSubmitRef.current = null;
       
       setMessages(prev => [...prev, response.data]);
       setInputMessage('');
@@ -1164,7 +1172,7 @@ const CustomerSupport = () => {
                     >
                       <div className="bg-gradient-to-r from-pink-600 to-cyan-600 text-white rounded-2xl rounded-br-sm px-6 py-3 max-w-md shadow-lg">
                         <p className="leading-relaxed">{message.user_message}</p>
-                        {message.file_content && (
+                        {(message.file_hash || message.file_content) && (
                           <motion.div 
                             className="mt-3 p-3 bg-white/20 rounded-xl backdrop-blur-sm"
                             whileHover={{ scale: 1.02 }}
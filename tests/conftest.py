@@ -0,0 +1,8 @@
+import sys
+from pathlib import Path
+
+# Backend modules are imported as top-level modules, the way server.py imports them
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+# Integration scripts that need a running deployment, not pytest tests
+collect_ignore = ["backend_test.py"]
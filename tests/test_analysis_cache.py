@@ -0,0 +1,33 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from mongomock_motor import AsyncMongoMockClient
+
+from analysis_cache import AnalysisCache
+
+
+def test_changing_the_ttl_does_not_conflict_with_the_existing_index():
+    async def scenario():
+        collection = AsyncMongoMockClient()["test"]["analysis_cache"]
+        await AnalysisCache(collection, ttl_seconds=120).ensure_indexes()
+        await AnalysisCache(collection, ttl_seconds=240).ensure_indexes()
+        return await collection.index_information()
+
+    indexes = asyncio.run(scenario())
+    assert indexes["expires_at_ttl"]["expireAfterSeconds"] == 0
+
+
+def test_entries_expire_by_their_own_expires_at():
+    async def scenario():
+        collection = AsyncMongoMockClient()["test"]["analysis_cache"]
+        cache = AnalysisCache(collection, ttl_seconds=60)
+        await cache.set("fresh", {"summary": "a"})
+        await cache.set("stale", {"summary": "b"})
+        past = datetime.utcnow() - timedelta(seconds=1)
+        await collection.update_one({"_id": "stale"}, {"$set": {"expires_at": past}})
+
+        # A new process: nothing in memory, everything from Mongo
+        reloaded = AnalysisCache(collection, ttl_seconds=60)
+        return await reloaded.get("fresh"), await reloaded.get("stale")
+
+    assert asyncio.run(scenario()) == ({"summary": "a"}, None)
@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+from analysis_parser import parse_analysis_response, parse_structured_analysis
+
+
+def test_well_formed_answer_is_parsed():
+    answer = "Here you go:\n" + json.dumps({
+        "summary": "S",
+        "key_insights": [" first ", "", "second"],
+        "sentiment_score": 3,
+        "entities": [{"name": "Acme", "type": "org"}, "Bob", {"type": "person"}]
+    })
+
+    assert parse_structured_analysis(answer) == {
+        "summary": "S",
+        "key_insights": ["first", "second"],
+        "sentiment_score": 1.0,
+        "entities": [{"name": "Acme", "type": "org"}, {"name": "Bob", "type": "other"}]
+    }
+
+
+def test_fields_of_the_wrong_type_are_not_iterated():
+    parsed = parse_structured_analysis('{"summary":"S","key_insights":"one long insight","entities":{"a":1}}')
+
+    assert parsed["key_insights"] == ["one long insight"]
+    assert parsed["entities"] == []
+
+
+def test_non_list_non_string_fields_become_empty():
+    parsed = parse_structured_analysis('{"summary":"S","key_insights":42,"entities":"Acme","sentiment_score":"0.5"}')
+
+    assert parsed["key_insights"] == []
+    assert parsed["entities"] == [{"name": "Acme", "type": "other"}]
+    assert parsed["sentiment_score"] == 0.5
+
+
+@pytest.mark.parametrize("score", ["NaN", "Infinity", "-Infinity", "true", '"high"', "null"])
+def test_unusable_sentiment_scores_are_dropped(score):
+    parsed = parse_structured_analysis('{"summary":"S","sentiment_score":%s}' % score)
+
+    assert parsed["sentiment_score"] is None
+
+
+def test_malformed_full_answer_falls_back_to_text_parsing():
+    fields = parse_analysis_response('{"summary": 5} The outlook is positive overall', "full")
+
+    assert fields["summary"].startswith('{"summary": 5}')
+    assert fields["sentiment_score"] == 0.7
@@ -0,0 +1,43 @@
+import asyncio
+from datetime import datetime
+
+from mongomock_motor import AsyncMongoMockClient
+
+from archive import ChatArchive, decode_bundle, encode_bundle
+
+
+def test_bundle_round_trips_messages():
+    messages = [
+        {"id": f"m{index}", "session_id": "s", "ai_response": "answer " * 50, "timestamp": datetime(2026, 1, 1, 0, 0, index)}
+        for index in range(3)
+    ]
+    for codec in ("zstd", "gzip"):
+        assert decode_bundle(encode_bundle(messages, codec, 3), codec) == messages
+
+
+class NoQueries:
+    def __getattr__(self, name):
+        raise AssertionError(f"unexpected {name} call")
+
+
+def make_archive(sessions, idle_days: int) -> ChatArchive:
+    async def store_blob(data, content_type):
+        raise AssertionError("nothing should be stored")
+
+    return ChatArchive(sessions, NoQueries(), None, store_blob, idle_days=idle_days)
+
+
+def test_disabled_archive_skips_the_session_lookup():
+    asyncio.run(make_archive(NoQueries(), idle_days=0).rehydrate("s"))
+
+
+def test_disabled_archive_still_restores_leftover_archives():
+    async def scenario():
+        sessions = AsyncMongoMockClient()["test"]["chat_sessions"]
+        await sessions.insert_one({"id": "hot"})
+        archive = make_archive(sessions, idle_days=0)
+        before = await archive.find_leftover_archives()
+        await sessions.insert_one({"id": "old", "archive": {"hash": "h", "codec": "zstd"}})
+        return before, await make_archive(sessions, idle_days=0).find_leftover_archives()
+
+    assert asyncio.run(scenario()) == (False, True)
@@ -0,0 +1,29 @@
+import asyncio
+import hashlib
+
+from blob_store import BlobStore
+from offload import CpuOffloader
+from spool import SpoolManager
+
+
+def test_hashing_runs_through_the_offloader(tmp_path):
+    offloader = CpuOffloader(workers=2, threshold_bytes=1024)
+    spool = SpoolManager(tmp_path / "spool", quota_bytes=10 * 1024 * 1024, run_cpu=offloader.run)
+    store = BlobStore(tmp_path / "blobs", spool, run_cpu=offloader.run)
+    data = bytes(range(256)) * 64
+
+    async def chunks():
+        for start in range(0, len(data), 4096):
+            yield data[start:start + 4096]
+
+    async def scenario():
+        return await store.put_bytes(data), await store.put_stream(chunks())
+
+    try:
+        digest, (streamed, size) = asyncio.run(scenario())
+    finally:
+        offloader.shutdown()
+    assert digest == streamed == hashlib.sha256(data).hexdigest() and size == len(data)
+    assert store.path_for(digest).read_bytes() == data
+    assert offloader.offloaded == 2
+    assert spool.used_bytes == 0 and not list((tmp_path / "spool").iterdir())
@@ -0,0 +1,65 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from mongomock_motor import AsyncMongoMockClient
+
+from conversation import ConversationContext
+
+
+async def seed(messages, count: int, answer_chars: int) -> None:
+    started = datetime(2026, 1, 1)
+    await messages.insert_many([
+        {
+            "id": f"m{index:02d}",
+            "session_id": "s",
+            "user_message": f"question {index}",
+            "ai_response": f"answer {index} " + "x" * answer_chars,
+            "timestamp": started + timedelta(seconds=index)
+        }
+        for index in range(count)
+    ])
+
+
+def make_context(budget_tokens: int, summary_every: int = 10) -> ConversationContext:
+    db = AsyncMongoMockClient()["test"]
+    return ConversationContext(db.chat_messages, db.chat_summaries, budget_tokens=budget_tokens, summary_every=summary_every)
+
+
+async def summarize(prompt: str) -> str:
+    return "summary of " + ", ".join(line.split(": ")[1] for line in prompt.splitlines() if line.startswith("Customer: "))
+
+
+def test_turns_that_overflow_the_budget_are_summarized_before_the_count_is_reached():
+    async def scenario():
+        context = make_context(budget_tokens=1200)
+        await seed(context.messages, 12, answer_chars=800)
+        rolled = await context.roll_up("s", summarize)
+        prompt = await context.build_prompt("s", "new question")
+        return rolled, prompt
+
+    rolled, prompt = asyncio.run(scenario())
+    assert rolled
+    # Every turn is either in the summary or verbatim
+    for index in range(12):
+        assert f"question {index}" in prompt
+    assert "question 0" in prompt.split("Recent conversation:")[0]
+
+
+def test_short_history_within_the_budget_is_left_alone():
+    async def scenario():
+        context = make_context(budget_tokens=4000)
+        await seed(context.messages, 5, answer_chars=20)
+        return await context.roll_up("s", summarize), await context.summaries.count_documents({})
+
+    assert asyncio.run(scenario()) == (False, 0)
+
+
+def test_count_trigger_keeps_the_newest_turns_verbatim():
+    async def scenario():
+        context = make_context(budget_tokens=100000, summary_every=3)
+        await seed(context.messages, 6, answer_chars=20)
+        await context.roll_up("s", summarize)
+        return await context.summaries.find_one({"session_id": "s"})
+
+    summary = asyncio.run(scenario())
+    assert summary["covered_count"] == 3 and summary["covered_id"] == "m02"
@@ -0,0 +1,29 @@
+from db_indexes import ROUTE_QUERIES, plan_stages
+
+
+def test_every_paginated_route_is_also_checked_with_a_cursor():
+    checked = {route: query for route, _, query, _ in ROUTE_QUERIES}
+    paginated = [
+        route for route, _, _, sort in ROUTE_QUERIES
+        if route.startswith("GET ") and "?" not in route and sort and len(sort) == 2
+    ]
+
+    assert paginated
+    for route in paginated:
+        after = checked[f"{route}?after="]
+        assert set(after) - set(checked[route]) == {"$or"}
+
+
+def test_cursor_condition_follows_the_sort_direction():
+    queries = {route: query for route, _, query, _ in ROUTE_QUERIES}
+
+    assert "$lt" in queries["GET /api/documents/analyses?after="]["$or"][0]["timestamp"]
+    assert "$gt" in queries["GET /api/chat/messages/{session_id}?after="]["$or"][0]["timestamp"]
+
+
+def test_plan_stages_walk_or_branches():
+    plan = {"stage": "FETCH", "inputStage": {"stage": "SORT_MERGE", "inputStages": [
+        {"stage": "IXSCAN"}, {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}}
+    ]}}
+
+    assert plan_stages(plan) == ["FETCH", "SORT_MERGE", "IXSCAN", "FETCH", "IXSCAN"]
@@ -0,0 +1,30 @@
+from extraction import OLE_MAGIC, chunk_text, extract_text
+
+
+def test_csv_labelled_as_excel_is_extracted(tmp_path):
+    path = tmp_path / "report.csv"
+    path.write_text("name,total\nalpha,1\n")
+
+    assert extract_text(str(path), "application/vnd.ms-excel") == "name | total\nalpha | 1"
+
+
+def test_binary_xls_is_not_read_as_csv(tmp_path):
+    path = tmp_path / "report.xls"
+    path.write_bytes(OLE_MAGIC + bytes(range(256)) * 8)
+
+    assert extract_text(str(path), "application/vnd.ms-excel") is None
+
+
+def test_chunks_cover_the_text_within_the_limit():
+    text = "\n\n".join(f"Paragraph {index} " + "word " * 50 for index in range(40))
+    chunks = chunk_text(text, 1000)
+
+    assert all(len(chunk) <= 1000 for chunk in chunks)
+    assert "Paragraph 0" in chunks[0] and "Paragraph 39" in chunks[-1]
+
+
+def test_chunks_end_at_a_paragraph_break_before_a_later_line_break():
+    text = "a" * 700 + "\n\n" + "b" * 200 + "\nline" + "c" * 500
+    chunks = chunk_text(text, 1000, overlap_chars=0)
+
+    assert chunks[0] == "a" * 700
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+from starlette.responses import JSONResponse
+
+from idempotency import IdempotencyConflict, IdempotentRequests
+
+
+def make_requests() -> IdempotentRequests:
+    return IdempotentRequests(AsyncMongoMockClient()["test"]["idempotency_keys"], ttl=60)
+
+
+def counting_handler():
+    calls = []
+
+    async def handler():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return JSONResponse({"call": len(calls)}, status_code=201, headers={"Location": "/x"})
+
+    return handler, calls
+
+
+def test_concurrent_requests_with_a_key_share_one_call():
+    async def scenario():
+        requests = make_requests()
+        handler, calls = counting_handler()
+        results = await asyncio.gather(*[requests.run("chat", "key", "fp", handler) for _ in range(4)])
+        return results, calls
+
+    results, calls = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False, True, True, True]
+    assert {response.body for response, _ in results} == {b'{"call":1}'}
+
+
+def test_keyed_response_is_replayed_after_completion():
+    async def scenario():
+        requests = make_requests()
+        handler, calls = counting_handler()
+        await requests.run("chat", "key", "fp", handler)
+        response, shared = await requests.run("chat", "key", "fp", handler)
+        return response, shared, calls
+
+    response, shared, calls = asyncio.run(scenario())
+    assert len(calls) == 1 and shared
+    assert response.status_code == 201
+    assert response.headers["location"] == "/x"
+
+
+def test_key_reused_with_a_different_payload_conflicts():
+    async def scenario():
+        requests = make_requests()
+        handler, _ = counting_handler()
+        await requests.run("chat", "key", "fp", handler)
+        await requests.run("chat", "key", "other", handler)
+
+    with pytest.raises(IdempotencyConflict):
+        asyncio.run(scenario())
+
+
+def test_unkeyed_payload_is_only_coalesced_while_in_flight():
+    async def scenario():
+        requests = make_requests()
+        handler, calls = counting_handler()
+        await asyncio.gather(requests.run("chat", None, "fp", handler), requests.run("chat", None, "fp", handler))
+        await requests.run("chat", None, "fp", handler)
+        return calls
+
+    assert len(asyncio.run(scenario())) == 2
+
+
+def test_failures_are_not_stored():
+    async def scenario():
+        requests = make_requests()
+        attempts = []
+
+        async def flaky():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise RuntimeError("boom")
+            return JSONResponse({"ok": True})
+
+        with pytest.raises(RuntimeError):
+            await requests.run("chat", "key", "fp", flaky)
+        response, shared = await requests.run("chat", "key", "fp", flaky)
+        return response, shared, attempts
+
+    response, shared, attempts = asyncio.run(scenario())
+    assert len(attempts) == 2 and not shared
+    assert response.body == b'{"ok":true}'
+
+
+def test_concurrent_identical_requests_with_different_keys_share_one_call():
+    async def scenario():
+        requests = make_requests()
+        handler, calls = counting_handler()
+        results = await asyncio.gather(
+            requests.run("chat", "k1", "fp", handler),
+            requests.run("chat", "k2", "fp", handler)
+        )
+        # Both keys replay the shared response afterwards
+        replays = [await requests.run("chat", key, "fp", handler) for key in ("k1", "k2")]
+        return results, replays, calls
+
+    results, replays, calls = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False, True]
+    assert all(shared and response.body == b'{"call":1}' for response, shared in replays)
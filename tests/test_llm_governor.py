@@ -0,0 +1,190 @@
+import asyncio
+
+import pytest
+
+from llm_governor import CircuitOpenError, LlmGovernor, LlmThrottledError, is_throttle_error, is_transient_error
+
+
+class FakeLlm:
+    """Stands in for LlmChat.send_message: fails with the queued errors first, then answers."""
+
+    def __init__(self, *errors: Exception, latency: float = 0.0):
+        self.errors = list(errors)
+        self.latency = latency
+        self.calls = 0
+
+    async def send(self) -> str:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if self.errors:
+            raise self.errors.pop(0)
+        return "answer"
+
+
+def make_governor(**overrides) -> LlmGovernor:
+    settings = dict(
+        requests_per_minute=6000,
+        tokens_per_minute=1_000_000,
+        max_concurrency=8,
+        target_latency=1.0,
+        max_retries=3,
+        backoff_base=0.001,
+        backoff_cap=0.01,
+        failure_threshold=3,
+        reset_seconds=0.1
+    )
+    settings.update(overrides)
+    return LlmGovernor(**settings)
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_throttled_call_is_retried_until_it_succeeds():
+    governor = make_governor()
+    llm = FakeLlm(Exception("429 Resource exhausted"), Exception("503 unavailable"))
+
+    assert run(governor.call(llm.send)) == "answer"
+    assert llm.calls == 3
+    assert governor.retries == 2
+    assert governor.throttled == 1
+
+
+def test_persistent_throttling_raises_after_max_retries():
+    governor = make_governor(max_retries=2, failure_threshold=100)
+    llm = FakeLlm(*[Exception("429 rate limit")] * 5)
+
+    with pytest.raises(LlmThrottledError):
+        run(governor.call(llm.send))
+    assert llm.calls == 3
+
+
+def test_bad_request_is_not_retried_and_keeps_circuit_closed():
+    governor = make_governor()
+    llm = FakeLlm(ValueError("invalid argument"))
+
+    with pytest.raises(ValueError):
+        run(governor.call(llm.send))
+    assert llm.calls == 1
+    assert governor.breaker.state == "closed"
+
+
+def test_request_bucket_spaces_out_calls():
+    async def scenario():
+        governor = make_governor(requests_per_minute=600)  # 10 per second
+        governor.request_bucket.tokens = 0
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await governor.call(FakeLlm().send)
+        return loop.time() - started
+
+    assert run(scenario()) >= 0.09
+
+
+def test_limiter_halves_on_throttling_and_grows_on_success():
+    async def scenario():
+        governor = make_governor(max_retries=0, failure_threshold=100)
+        with pytest.raises(LlmThrottledError):
+            await governor.call(FakeLlm(Exception("429")).send)
+        after_throttle = governor.limiter.limit
+        for _ in range(20):
+            await governor.call(FakeLlm().send)
+        return after_throttle, governor.limiter.limit
+
+    after_throttle, after_successes = run(scenario())
+    assert after_throttle == 4
+    assert 4 < after_successes <= 8
+
+
+def test_slow_calls_shrink_the_limit():
+    governor = make_governor(target_latency=0.01)
+    run(governor.call(FakeLlm(latency=0.05).send))
+    assert governor.limiter.limit == 4
+
+
+def test_breaker_opens_then_recovers_through_a_trial_call():
+    async def scenario():
+        governor = make_governor(max_retries=0)
+        for _ in range(3):
+            with pytest.raises(Exception):
+                await governor.call(FakeLlm(Exception("502 bad gateway")).send)
+        assert governor.breaker.state == "open"
+        with pytest.raises(CircuitOpenError):
+            await governor.call(FakeLlm().send)
+
+        await asyncio.sleep(0.11)
+        assert governor.breaker.state == "half_open"
+        assert await governor.call(FakeLlm().send) == "answer"
+        return governor
+
+    governor = run(scenario())
+    assert governor.breaker.state == "closed"
+    assert governor.rejected == 1
+
+
+def test_failed_trial_reopens_the_breaker():
+    async def scenario():
+        governor = make_governor(max_retries=0)
+        for _ in range(3):
+            with pytest.raises(Exception):
+                await governor.call(FakeLlm(Exception("timeout")).send)
+        await asyncio.sleep(0.11)
+        with pytest.raises(Exception):
+            await governor.call(FakeLlm(Exception("timeout")).send)
+        return governor.breaker.state
+
+    assert run(scenario()) == "open"
+
+
+def test_cancelled_trial_does_not_wedge_the_breaker():
+    async def scenario():
+        governor = make_governor(max_retries=0)
+        for _ in range(3):
+            with pytest.raises(Exception):
+                await governor.call(FakeLlm(Exception("503")).send)
+        await asyncio.sleep(0.11)
+
+        # The trial call is admitted, then cancelled while waiting for a drained request bucket
+        governor.request_bucket.tokens = -100
+        trial = asyncio.ensure_future(governor.call(FakeLlm().send))
+        await asyncio.sleep(0.01)
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+
+        governor.request_bucket.tokens = governor.request_bucket.capacity
+        return await governor.call(FakeLlm().send), governor.breaker.state
+
+    assert run(scenario()) == ("answer", "closed")
+
+
+class StatusError(Exception):
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+@pytest.mark.parametrize("message", [
+    "prompt has 15000 tokens",
+    "File too large: 5041234 bytes",
+    "see connection docs",
+    "quota project not set (invalid api key)"
+])
+def test_permanent_errors_are_not_retried_or_counted(message):
+    assert not is_transient_error(Exception(message))
+    assert not is_throttle_error(Exception(message))
+
+    governor = make_governor(failure_threshold=1)
+    llm = FakeLlm(ValueError(message))
+    with pytest.raises(ValueError):
+        run(governor.call(llm.send))
+    assert llm.calls == 1
+    assert governor.breaker.state == "closed"
+
+
+def test_status_code_decides_before_the_message():
+    assert not is_transient_error(StatusError("upstream 503 mentioned in a 400", 400))
+    assert is_transient_error(StatusError("bad gateway", 502))
+    assert is_throttle_error(StatusError("slow down", 429))
+    assert not is_throttle_error(StatusError("rate limit docs", 403))
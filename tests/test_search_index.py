@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+
+from search_index import SearchIndex, SearchIndexLocked, SearchIndexWriter
+
+
+def test_second_process_cannot_open_an_owned_directory(tmp_path):
+    index = SearchIndex(tmp_path, dim=64)
+    with pytest.raises(SearchIndexLocked):
+        SearchIndex(tmp_path, dim=64)
+
+    index.close()
+    SearchIndex(tmp_path, dim=64).close()
+
+
+def test_writer_indexes_queued_records_off_the_loop(tmp_path):
+    async def scenario():
+        index = SearchIndex(tmp_path, dim=256, flush_every=4)
+        writer = SearchIndexWriter(index, batch_size=8, flush_interval=0.01)
+        writer.start()
+        for number in range(20):
+            await writer.add("message", f"m{number}", "s1", f"invoice number {number} overdue", "snippet")
+        await writer.add("analysis", "a1", "s2", "quarterly revenue grew", "revenue")
+        await writer.stop()
+        index.close()
+        return writer.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["indexed"] == 21 and stats["queued"] == 0
+
+    reopened = SearchIndex(tmp_path, dim=256)
+    assert len(reopened) == 21
+    assert reopened.search("revenue")[0]["id"] == "a1"
+    assert {hit["kind"] for hit in reopened.search("invoice overdue", session_id="s1")} == {"message"}
+    reopened.close()
+
+
+def test_cursors_are_saved_with_the_index(tmp_path):
+    index = SearchIndex(tmp_path, dim=64)
+    index.add("analysis", "a1", None, "some indexed text")
+    index.set_cursor("analysis", "2026-01-01T00:00:00")
+    index.close()
+
+    reopened = SearchIndex(tmp_path, dim=64)
+    assert reopened.cursors == {"analysis": "2026-01-01T00:00:00"} and len(reopened) == 1
+    reopened.close()